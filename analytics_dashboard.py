@@ -3,13 +3,18 @@ Skannr AI Analytics Dashboard - Production Ready
 All deprecation warnings fixed
 """
 
+import os
+from datetime import datetime, time, timedelta
+
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from database import engine
-from models import TriageLog, ClinicianFeedback
-from sqlalchemy.orm import sessionmaker
+from database import engine, session_scope
+import feedback
+import figures
+import queries
+import migrations
+import profiling
+from data_loader import ChangeTracker, read_range
 
 # ============================================
 # PAGE CONFIG & STYLING
@@ -47,48 +52,120 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database session
-Session = sessionmaker(bind=engine)
-session = Session()
+# Opt-in profiling (SKANNR_PROFILE=1 or ?profile=1): see profiling.py
+profiler = profiling.Profiler(enabled=profiling.enabled_by_env() or st.query_params.get("profile") == "1")
+profiling.instrument(engine)
+
+
+def show_profile():
+    """Close the profile and render it in a collapsible debug panel."""
+    if not profiler.enabled:
+        return
+    profiler.finish()
+    profiler.log()
+    sections = profiler.sections_frame()
+    with st.expander(f"🛠 Performance profile — {sections['seconds'].sum():.2f}s, "
+                     f"{sections['queries'].sum()} queries"):
+        st.dataframe(sections, use_container_width=True, hide_index=True)
+        cache = get_figure_cache().stats()
+        st.caption(f"Figure cache: {cache['entries']} figures, {cache['hits']} hits, {cache['misses']} misses")
+        st.markdown("#### SQL statements")
+        st.dataframe(profiler.statements_frame(), use_container_width=True, hide_index=True)
+        st.download_button("Download profile (JSON lines)", profiler.to_jsonl(),
+                           file_name=f"profile_{profiler.run_id}.jsonl", mime="application/x-ndjson")
+
+# Cached data access (shared across sessions)
+@st.cache_resource
+def init_db():
+    """Apply schema upgrades (indexes, rollups) once per process."""
+    migrations.upgrade(engine)
+
+
+@st.cache_resource
+def get_tracker():
+    """One change tracker shared by every session; cached queries key on its table versions."""
+    return ChangeTracker(engine)
+
+
+@st.cache_resource
+def get_figure_cache():
+    """Built figures shared by every session (LRU, keyed by their input data)."""
+    return figures.FigureCache()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_query(name, table_versions, **kwargs):
+    """Run ``queries.<name>``; results are reused until a table it reads changes."""
+    with session_scope() as s:
+        return getattr(queries, name)(s, **kwargs)
+
 
 # ============================================
 # LOAD DATA
 # ============================================
+profiler.section("Load")
+tracker = get_tracker()
 try:
-    triage_logs = session.query(TriageLog).all()
-    triage_df = pd.DataFrame([{
-        "id": t.id, "created_at": t.created_at, "symptoms_text": t.symptoms_text,
-        "age": t.age, "sex": t.sex, "pregnancy": t.pregnancy, "implants": t.implants,
-        "location": t.location, "triage": t.triage, "primary_modality": t.primary_modality,
-        "primary_priority": t.primary_priority, "model_name": t.model_name
-    } for t in triage_logs])
-    if not triage_df.empty:
-        triage_df['created_at'] = pd.to_datetime(triage_df['created_at'])
-        triage_df['date'] = triage_df['created_at'].dt.date
+    init_db()
+    tracker.refresh()
 except Exception as e:
     st.error(f"Error loading triage logs: {e}")
-    triage_df = pd.DataFrame()
+# What this session's page was built from; the live watcher compares against it.
+st.session_state.seen_versions = dict(tracker.table_versions)
+
+
+def query(name, **kwargs):
+    versions = tuple(tracker.table_versions[t] for t in queries.QUERY_TABLES[name])
+    return cached_query(name, versions, **kwargs)
+
+
+def chart(builder, *args, **kwargs):
+    """``st.plotly_chart`` of ``figures.<builder>``, reusing the figure while its inputs are unchanged."""
+    st.plotly_chart(get_figure_cache().get(builder, *args, **kwargs), use_container_width=True)
+
+
+def windowed(name, **kwargs):
+    """``query`` restricted to the sidebar time range."""
+    return query(name, start=window_start, end=window_end, **kwargs)
 
-try:
-    feedback_logs = (
-        session.query(ClinicianFeedback, TriageLog)
-        .join(TriageLog, ClinicianFeedback.triage_log_id == TriageLog.id)
-        .order_by(ClinicianFeedback.id.desc()).all()
-    )
-    feedback_df = pd.DataFrame([{
-        "id_fb": fb.id, "triage_log_id": tl.id, "clinician_scan": fb.clinician_scan,
-        "accepted_recommendation": fb.accepted_recommendation, "comment": fb.comment,
-        "created_at": tl.created_at, "primary_modality": tl.primary_modality, "symptoms_text": tl.symptoms_text,
-    } for fb, tl in feedback_logs])
-    if not feedback_df.empty:
-        feedback_df['created_at'] = pd.to_datetime(feedback_df['created_at'])
-except Exception as e:
-    st.error(f"Error loading feedback: {e}")
-    feedback_df = pd.DataFrame()
 
 # ============================================
 # SIDEBAR
 # ============================================
+TIME_RANGES = {
+    "Last 24 hours": timedelta(hours=24),
+    "Last 7 days": timedelta(days=7),
+    "Last 30 days": timedelta(days=30),
+    "Last 90 days": timedelta(days=90),
+    "Last 12 months": timedelta(days=365),
+    "All time": None,
+    "Custom": None,
+}
+BUCKET_TITLES = {"hour": "Hourly", "day": "Daily", "week": "Weekly", "month": "Monthly"}
+
+# Live mode (sidebar toggle; on by default with SKANNR_LIVE=1 or ?live=1)
+LIVE_DEFAULT = os.environ.get("SKANNR_LIVE", "").lower() in ("1", "true", "yes") or st.query_params.get("live") == "1"
+LIVE_DEFAULT_INTERVAL = int(os.environ.get("SKANNR_LIVE_INTERVAL", 15))  # seconds
+LIVE_INTERVALS = sorted({2, 5, 15, 30, 60, LIVE_DEFAULT_INTERVAL})
+
+
+def watch_changes():
+    """Live-mode poll: one PRAGMA data_version when idle, a full rerun only on new data.
+
+    As results are cached per table version, the rerun recomputes only the
+    aggregates over the table that changed.
+    """
+    tracker.refresh()
+    if tracker.table_versions != st.session_state.get("seen_versions"):
+        st.rerun()
+    st.caption(f"● Live · checked {datetime.now():%H:%M:%S}")
+
+first_day, last_day = query("date_bounds")
+archived_before = query("archive_cutoff")
+# Minute resolution keeps "now"-relative windows cacheable across reruns.
+now = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(minutes=1)
+today = datetime.combine(now.date(), time())
+
 with st.sidebar:
     st.markdown("""
     <div style="text-align: center; padding: 20px 0;">
@@ -96,13 +173,60 @@ with st.sidebar:
         <p style="color: #94a3b8; font-size: 14px;">Analytics Dashboard</p>
     </div>
     """, unsafe_allow_html=True)
+    st.markdown("---")
+    st.markdown("### Time Range")
+    time_range = st.selectbox("Period", list(TIME_RANGES), index=list(TIME_RANGES).index("All time"))
+    span = TIME_RANGES[time_range]
+    if time_range == "Last 24 hours":
+        window_start, window_end = now - span, now
+    elif span is not None:
+        # Whole days (today included) so the window is served from the daily rollups.
+        window_start, window_end = today + timedelta(days=1) - span, today + timedelta(days=1)
+    elif time_range == "Custom":
+        picked = st.date_input("Dates", value=(first_day or today.date(), last_day or today.date()))
+        window_start = datetime.combine(picked[0], time()) if len(picked) > 0 else None
+        window_end = datetime.combine(picked[-1], time()) + timedelta(days=1) if len(picked) > 0 else None
+    else:
+        window_start, window_end = None, None
+
+    buckets = queries.granularities(window_start, window_end, archived_before)
+    granularity = st.selectbox("Granularity", ["Auto", *buckets],
+                               format_func=lambda g: g if g == "Auto" else BUCKET_TITLES[g])
+    if granularity == "Auto":
+        span_start = window_start or (datetime.combine(first_day, time()) if first_day else today)
+        span_end = window_end or (datetime.combine(last_day, time()) + timedelta(days=1) if last_day else now)
+        granularity = queries.choose_granularity(span_start, span_end)
+        if granularity not in buckets:
+            granularity = buckets[0]
+    if queries.reaches_archive(window_start, archived_before):
+        st.caption(f"Cases before {archived_before:%Y-%m-%d} are archived; hourly buckets are not available.")
+
+    st.markdown("---")
+    st.markdown("### Live Updates")
+    live = st.toggle("Live", value=LIVE_DEFAULT, help="Check for new cases and feedback and update the page when they arrive.")
+    if live:
+        interval = st.selectbox("Check every", LIVE_INTERVALS, index=LIVE_INTERVALS.index(LIVE_DEFAULT_INTERVAL),
+                                format_func=lambda s: f"{s} seconds")
+        st.fragment(watch_changes, run_every=interval)()
+
+profiler.section("Key metrics")
+try:
+    kpis = windowed("kpi_totals")
+except Exception as e:
+    st.error(f"Error loading triage logs: {e}")
+    kpis = {"total_cases": 0, "feedback_count": 0}
+
+has_logs = kpis["total_cases"] > 0
+has_feedback = kpis["feedback_count"] > 0
+
+with st.sidebar:
     st.markdown("---")
     st.markdown("### Quick Stats")
-    if not triage_df.empty:
-        st.metric("Total Cases", len(triage_df))
-        st.metric("Emergencies", (triage_df["triage"] == "URGENT_EMERGENCY").sum())
-        if not feedback_df.empty:
-            st.metric("AI Accuracy", f"{feedback_df['accepted_recommendation'].mean() * 100:.1f}%")
+    if has_logs:
+        st.metric("Total Cases", kpis["total_cases"])
+        st.metric("Emergencies", kpis["emergency_cases"])
+        if has_feedback:
+            st.metric("AI Accuracy", f"{(kpis['agreement_rate'] or 0) * 100:.1f}%")
     st.markdown("---")
     st.markdown('<p style="color: #64748b; font-size: 12px; text-align: center;">Dashboard v3.0</p>', unsafe_allow_html=True)
 
@@ -114,27 +238,28 @@ with col1:
     st.title("Skannr AI Analytics")
     st.markdown('<p style="color: #94a3b8;">Real-time monitoring of AI triage performance</p>', unsafe_allow_html=True)
 with col2:
-    if not triage_df.empty:
-        st.markdown("""
+    if has_logs:
+        st.markdown(f"""
         <div style="background: #065f46; border-radius: 12px; padding: 15px; text-align: center;">
             <p style="color: #a7f3d0; font-size: 12px; margin: 0;">Status</p>
-            <p style="color: #ecfdf5; font-size: 18px; font-weight: 700; margin: 5px 0;">● Online</p>
+            <p style="color: #ecfdf5; font-size: 18px; font-weight: 700; margin: 5px 0;">● {"Live" if live else "Online"}</p>
         </div>
         """, unsafe_allow_html=True)
 
 st.markdown("---")
 
-if triage_df.empty:
-    st.warning("⚠️ No triage logs found yet.")
+if not has_logs:
+    st.warning("⚠️ No triage logs found yet." if first_day is None else "⚠️ No triage logs in the selected period.")
+    show_profile()
     st.stop()
 
 # ============================================
 # KEY METRICS
 # ============================================
-total_cases = len(triage_df)
-emergency_cases = (triage_df["triage"] == "URGENT_EMERGENCY").sum()
-non_emergency_cases = (triage_df["triage"] == "NON_EMERGENCY").sum()
-cases_with_feedback = feedback_df["triage_log_id"].nunique() if not feedback_df.empty else 0
+total_cases = kpis["total_cases"]
+emergency_cases = kpis["emergency_cases"]
+non_emergency_cases = kpis["non_emergency_cases"]
+cases_with_feedback = kpis["cases_with_feedback"]
 
 col1, col2, col3, col4 = st.columns(4)
 col1.metric("Total Cases", f"{int(total_cases):,}")
@@ -149,34 +274,16 @@ st.markdown("---")
 # ============================================
 st.header("🤖 AI Performance")
 
-if not feedback_df.empty:
-    agreement_rate = feedback_df["accepted_recommendation"].mean()
+if has_feedback:
+    agreement_rate = kpis["agreement_rate"] or 0
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        fig = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=agreement_rate * 100,
-            title={'text': "Agreement Rate", 'font': {'size': 16, 'color': '#e2e8f0'}},
-            number={'suffix': "%", 'font': {'size': 36, 'color': '#f59e0b'}},
-            gauge={
-                'axis': {'range': [0, 100]},
-                'bar': {'color': '#f59e0b'},
-                'bgcolor': '#1e293b',
-                'steps': [
-                    {'range': [0, 60], 'color': '#7f1d1d'},
-                    {'range': [60, 80], 'color': '#78350f'},
-                    {'range': [80, 100], 'color': '#14532d'}
-                ],
-                'threshold': {'line': {'color': '#22c55e', 'width': 4}, 'thickness': 0.75, 'value': 80}
-            }
-        ))
-        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', height=200, margin=dict(l=20, r=20, t=50, b=20))
-        st.plotly_chart(fig, use_container_width=True)
+        chart(figures.agreement_gauge, agreement_rate)
     
     col2.metric("Override Rate", f"{(1-agreement_rate)*100:.1f}%")
-    col3.metric("Disagreements", min(5, len(feedback_df[~feedback_df["accepted_recommendation"]])))
-    col4.metric("Coverage", f"{len(feedback_df)/total_cases*100:.1f}%")
+    col3.metric("Disagreements", min(5, kpis["disagreements"]))
+    col4.metric("Coverage", f"{kpis['feedback_count']/total_cases*100:.1f}%")
 else:
     st.info("Waiting for clinician feedback...")
 
@@ -185,221 +292,317 @@ st.markdown("---")
 # ============================================
 # AGREEMENT ANALYSIS
 # ============================================
-st.header("🎯 Agreement Analysis")
-
-if not feedback_df.empty and len(feedback_df) > 0:
-    tab1, tab2, tab3 = st.tabs(["Heatmap", "Disagreements", "Feedback"])
+def heatmap_tab(search_text):
+    st.subheader("AI vs Clinician Decisions")
     
-    with tab1:
-        st.subheader("AI vs Clinician Decisions")
-        
-        comparison = feedback_df.groupby(["primary_modality", "clinician_scan"]).size().reset_index(name="count")
-        comparison.columns = ["AI Scan", "Clinician Scan", "Count"]
-        pivot = comparison.pivot(index="AI Scan", columns="Clinician Scan", values="Count").fillna(0)
-        
-        if not pivot.empty:
-            fig = go.Figure(data=go.Heatmap(
-                z=pivot.values, x=pivot.columns, y=pivot.index,
-                colorscale=[[0, '#1e293b'], [0.5, '#0ea5e9'], [1, '#f59e0b']],
-                hovertemplate="AI: %{y}<br>Clinician: %{x}<br>Count: %{z}<extra></extra>",
-                colorbar=dict(title=dict(text="Cases", font=dict(color='#e2e8f0')))
-            ))
-            
-            for i, row in enumerate(pivot.index):
-                for j, col in enumerate(pivot.columns):
-                    val = pivot.iloc[i, j]
-                    if val > 0:
-                        fig.add_annotation(x=col, y=row, text=str(int(val)), showarrow=False,
-                            font=dict(color='white', size=14, family='Arial Black'))
-            
-            fig.update_layout(
-                title=dict(text='<b>Agreement Matrix</b>', font=dict(size=18, color='#e2e8f0')),
-                xaxis=dict(
-                    title=dict(text='Clinician Decision', font=dict(color='#e2e8f0')),
-                    tickangle=45, tickfont=dict(size=11, color='#94a3b8'), gridcolor='#334155'
-                ),
-                yaxis=dict(
-                    title=dict(text='AI Recommendation', font=dict(color='#e2e8f0')),
-                    tickfont=dict(size=11, color='#94a3b8'), gridcolor='#334155'
-                ),
-                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
-                height=500, margin=dict(l=150, r=50, t=80, b=150)
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            
-            st.markdown("#### Detailed Breakdown")
-            st.dataframe(comparison.sort_values("Count", ascending=False), use_container_width=True, hide_index=True)
-        
-        # Agreement by scan type
-        st.markdown("#### Agreement by Scan Type")
-        scan_agreement = feedback_df.groupby('primary_modality').agg({
-            'accepted_recommendation': ['sum', 'count', 'mean']
-        }).reset_index()
-        scan_agreement.columns = ['Scan Type', 'Agreements', 'Total', 'Rate']
-        scan_agreement['Rate'] = scan_agreement['Rate'] * 100
-        scan_agreement = scan_agreement.sort_values('Rate', ascending=True)
-        
-        colors = ['#ef4444' if r < 60 else '#f59e0b' if r < 80 else '#22c55e' for r in scan_agreement['Rate']]
-        
-        fig = go.Figure(go.Bar(
-            y=scan_agreement['Scan Type'], x=scan_agreement['Rate'], orientation='h',
-            marker=dict(color=colors),
-            text=[f"{r:.0f}%" for r in scan_agreement['Rate']],
-            textposition='outside', textfont=dict(color='#e2e8f0')
-        ))
-        fig.add_vline(x=80, line_dash="dash", line_color="#22c55e", annotation_text="Target: 80%")
-        fig.update_layout(
-            xaxis=dict(title=dict(text='Agreement Rate (%)', font=dict(color='#e2e8f0')), 
-                      range=[0, 110], tickfont=dict(color='#94a3b8'), gridcolor='#334155'),
-            yaxis=dict(tickfont=dict(color='#94a3b8')),
-            paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
-            height=max(300, len(scan_agreement) * 40), margin=dict(l=20, r=80, t=20, b=50)
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    comparison = figures.normalize_scans(windowed("agreement_matrix"))
     
-    with tab2:
-        st.subheader("Where AI Gets It Wrong")
-        disagreements = feedback_df[~feedback_df["accepted_recommendation"]]
+    if not comparison.empty:
+        chart(figures.agreement_heatmap, comparison)
         
-        if len(disagreements) > 0:
-            col1, col2 = st.columns(2)
-            with col1:
-                ai_overridden = disagreements['primary_modality'].value_counts().head(5)
-                fig = go.Figure(go.Bar(x=ai_overridden.values, y=ai_overridden.index, orientation='h',
-                    marker=dict(color='#ef4444'), text=ai_overridden.values, textposition='outside'))
-                fig.update_layout(title="Most Overridden AI Scans", paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='#0f172a', height=300, xaxis=dict(gridcolor='#334155'),
-                    yaxis=dict(tickfont=dict(color='#94a3b8')))
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                clinician_preferred = disagreements['clinician_scan'].value_counts().head(5)
-                fig = go.Figure(go.Bar(x=clinician_preferred.values, y=clinician_preferred.index, orientation='h',
-                    marker=dict(color='#22c55e'), text=clinician_preferred.values, textposition='outside'))
-                fig.update_layout(title="Clinician Preferred", paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='#0f172a', height=300, xaxis=dict(gridcolor='#334155'),
-                    yaxis=dict(tickfont=dict(color='#94a3b8')))
-                st.plotly_chart(fig, use_container_width=True)
-            
-            st.markdown("#### Recent Disagreements")
-            disp = disagreements[['created_at', 'primary_modality', 'clinician_scan', 'comment']].head(5)
-            disp.columns = ['Date', 'AI Said', 'Clinician Chose', 'Comment']
-            st.dataframe(disp, use_container_width=True, hide_index=True)
-        else:
-            st.success("🎉 Perfect agreement!")
+        st.markdown("#### Detailed Breakdown")
+        st.dataframe(comparison.sort_values("Count", ascending=False), use_container_width=True, hide_index=True)
     
-    with tab3:
-        st.subheader("Recent Feedback")
-        disp = feedback_df[['created_at', 'primary_modality', 'clinician_scan', 'accepted_recommendation', 'comment']].head(25)
-        disp.columns = ['Date', 'AI Scan', 'Clinician Scan', 'Accepted', 'Comment']
-        disp['Accepted'] = disp['Accepted'].apply(lambda x: '✅' if x else '❌')
+    # Agreement by scan type
+    st.markdown("#### Agreement by Scan Type")
+    scan_agreement = windowed("agreement_by_modality")
+    scan_agreement = scan_agreement.sort_values('Rate', ascending=True)
+    
+    chart(figures.agreement_by_scan, scan_agreement)
+
+
+def disagreements_tab(search_text):
+    st.subheader("Where AI Gets It Wrong")
+    if kpis["disagreements"] > 0:
+        col1, col2 = st.columns(2)
+        with col1:
+            ai_overridden = windowed("top_overridden", column="ai_scan", search_text=search_text)
+            chart(figures.overridden_bars, ai_overridden, "Most Overridden AI Scans", '#ef4444')
+        
+        with col2:
+            clinician_preferred = windowed("top_overridden", column="clinician_scan", search_text=search_text)
+            chart(figures.overridden_bars, clinician_preferred, "Clinician Preferred", '#22c55e')
+        
+        st.markdown("#### Recent Disagreements")
+        disagreements = windowed("recent_feedback", limit=5, disagreements_only=True,
+                              search_text=search_text)
+        disp = disagreements[['created_at', 'primary_modality', 'clinician_scan', 'comment']]
+        disp.columns = ['Date', 'AI Said', 'Clinician Chose', 'Comment']
         st.dataframe(disp, use_container_width=True, hide_index=True)
-else:
-    st.info("Waiting for feedback data...")
+    else:
+        st.success("🎉 Perfect agreement!")
+
+
+def feedback_tab(search_text):
+    st.subheader("Recent Feedback")
+    disp = windowed("recent_feedback", limit=25, search_text=search_text)
+    disp.columns = ['Date', 'AI Scan', 'Clinician Scan', 'Accepted', 'Comment']
+    disp['Accepted'] = disp['Accepted'].apply(lambda x: '✅' if x else '❌')
+    st.dataframe(disp, use_container_width=True, hide_index=True)
+
+
+@st.fragment
+def agreement_analysis():
+    """Search box and tabs rerun on their own; only the open tab is computed."""
+    search_text = st.text_input("🔎 Search cases", placeholder="e.g. chest pain pacemaker",
+                                help="Searches symptoms, implants and clinician notes. "
+                                     "Also filters the Disagreements and Feedback tabs.").strip()
+    if queries.reaches_archive(window_start, archived_before):
+        st.caption(f"Search, disagreements and feedback cover cases from {archived_before:%Y-%m-%d}; "
+                   "download the window below for archived cases.")
+    if search_text:
+        matches = query("search_cases", search_text=search_text)
+        with st.expander(f"{len(matches)} matching case{'s' if len(matches) != 1 else ''}", expanded=True):
+            disp = matches.copy()
+            disp.columns = ['Case', 'Date', 'Match', 'Triage', 'AI Scan']
+            st.dataframe(disp, use_container_width=True, hide_index=True)
+
+    if has_feedback:
+        tabs = st.tabs(["Heatmap", "Disagreements", "Feedback"], key="agreement_tab", on_change="rerun")
+        for tab, render in zip(tabs, (heatmap_tab, disagreements_tab, feedback_tab)):
+            if tab.open:
+                with tab:
+                    render(search_text)
+    else:
+        st.info("Waiting for feedback data...")
+
+
+profiler.section("Agreement analysis")
+st.header("🎯 Agreement Analysis")
+agreement_analysis()
+
+st.markdown("---")
+
+# ============================================
+# MODEL COMPARISON
+# ============================================
+def _pct(rate, low, high):
+    return "—" if pd.isna(rate) else f"{rate * 100:.1f}% ({low * 100:.1f}–{high * 100:.1f})"
+
+
+@st.fragment
+def model_comparison():
+    """Rolling per-model rates with 95% intervals; controls rerun only this section."""
+    col1, col2, col3 = st.columns(3)
+    metric = col1.selectbox("Metric", list(figures.MODEL_METRICS), format_func=figures.MODEL_METRICS.get,
+                            key="model_metric")
+    window_days = col2.selectbox("Rolling window", queries.ROLLING_WINDOWS, key="model_window",
+                                 format_func=lambda d: f"{d} days")
+    modality = col3.selectbox("Modality", ["All modalities", *query("modality_options")], key="model_modality")
+    modality = None if modality == "All modalities" else modality
+
+    summary = windowed("model_summary", modality=modality)
+    if summary.empty:
+        st.info("No cases with a model name in the selected period.")
+        return
+    disp = pd.DataFrame({
+        "Model": summary["model_name"],
+        "Cases": summary["cases"],
+        "Feedback": summary["accepted"] + summary["rejected"],
+        **{f"{title} (95% CI)": [_pct(*r) for r in summary[[f"{m}_rate", f"{m}_low", f"{m}_high"]].itertuples(index=False)]
+           for m, title in figures.MODEL_METRICS.items()},
+    })
+    st.dataframe(disp, use_container_width=True, hide_index=True)
+
+    series = windowed("model_rolling_metrics", window_days=window_days, modality=modality)
+    chart(figures.model_rates, series, metric, window_days)
+
+
+profiler.section("Model comparison")
+st.header("🧪 Model Comparison")
+model_comparison()
 
 st.markdown("---")
 
 # ============================================
 # VOLUME & TRENDS
 # ============================================
+profiler.section("Trends")
 st.header("Volume & Trends")
 
 col1, col2 = st.columns(2)
 
 with col1:
-    daily_volume = triage_df.groupby('date').size().reset_index(name='count')
-    fig = go.Figure(go.Scatter(x=daily_volume['date'], y=daily_volume['count'], mode='lines+markers',
-        line=dict(color='#f59e0b', width=3), fill='tozeroy', fillcolor='rgba(245, 158, 11, 0.1)'))
-    fig.update_layout(title="Daily Volume", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
-        xaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')),
-        yaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')), height=300)
-    st.plotly_chart(fig, use_container_width=True)
+    volume = windowed("volume_series", granularity=granularity)
+    chart(figures.volume_chart, volume, f"{BUCKET_TITLES[granularity]} Volume")
 
 with col2:
-    triage_counts = triage_df['triage'].value_counts()
-    fig = go.Figure(go.Pie(labels=triage_counts.index, values=triage_counts.values, hole=0.6,
-        marker=dict(colors=['#22c55e', '#ef4444']), textinfo='label+percent'))
-    fig.update_layout(title="Classification", paper_bgcolor='rgba(0,0,0,0)', height=300,
-        annotations=[dict(text=f'{total_cases}', x=0.5, y=0.5, font=dict(size=24, color='#e2e8f0'), showarrow=False)])
-    st.plotly_chart(fig, use_container_width=True)
+    triage_counts = windowed("triage_distribution")
+    chart(figures.triage_pie, triage_counts, total_cases)
 
 st.markdown("---")
 
 # ============================================
 # SCAN DISTRIBUTION
 # ============================================
+profiler.section("Scan distribution")
 st.header("🔬 Scan Distribution")
 
-scan_counts = triage_df['primary_modality'].value_counts().head(10)
-fig = go.Figure(go.Bar(y=scan_counts.index, x=scan_counts.values, orientation='h',
-    marker=dict(color=px.colors.sequential.YlOrBr[:len(scan_counts)][::-1]),
-    text=scan_counts.values, textposition='outside', textfont=dict(color='#e2e8f0')))
-fig.update_layout(title="Top Recommended Scans", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
-    xaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')),
-    yaxis=dict(tickfont=dict(color='#94a3b8')), height=400, margin=dict(r=80))
-st.plotly_chart(fig, use_container_width=True)
+scan_counts = windowed("scan_distribution", limit=10)
+chart(figures.scan_bars, scan_counts)
 
 st.markdown("---")
 
 # ============================================
 # CLINICIAN FEEDBACK FORM
 # ============================================
+profiler.section("Feedback form")
 st.header("Submit Clinician Feedback")
 
-if not triage_df.empty:
-    triage_df_display = triage_df.copy()
-    triage_df_display["label"] = (
-        triage_df_display["id"].astype(str) + " | " +
-        triage_df_display["created_at"].astype(str) + " | " +
-        triage_df_display["symptoms_text"].str.slice(0, 60)
-    )
-
-    selected_label = st.selectbox("Select Case", options=triage_df_display["label"], key="triage_selector")
-    selected_row = triage_df_display[triage_df_display["label"] == selected_label].iloc[0]
-    selected_id = int(selected_row["id"])
-
-    st.markdown(f"""
-    <div style="background: #1e3a5f; border-radius: 12px; padding: 20px; margin: 15px 0; border-left: 4px solid #f59e0b;">
-        <p style="color: #94a3b8; font-size: 12px; margin: 0;">AI RECOMMENDATION</p>
-        <p style="color: #f59e0b; font-size: 24px; font-weight: 700; margin: 5px 0;">{selected_row['primary_modality']}</p>
-        <p style="color: #64748b; margin: 0;">Priority: {selected_row['primary_priority']}</p>
-    </div>
-    """, unsafe_allow_html=True)
+CASE_PAGE_SIZE = 50
+CASE_STATUS_LABELS = {"pending": "Awaiting feedback", "reviewed": "Reviewed", "all": "All cases"}
+BULK_DECISIONS = {"Accept": True, "Override": False}
+
+
+def _older_cases(key):
+    st.session_state.case_cursors.append(key)
+
+
+def _newer_cases():
+    st.session_state.case_cursors.pop()
+
+
+def page_nav(page, cursors):
+    last = page.iloc[-1]
+    n1, n2, n3 = st.columns([1, 4, 1])
+    n1.button("◀ Newer", on_click=_newer_cases, disabled=len(cursors) == 1)
+    n2.caption(f"Page {len(cursors)}")
+    n3.button("Older ▶", on_click=_older_cases, args=((last["created_at"].to_pydatetime(), int(last["id"])),),
+              disabled=len(page) < CASE_PAGE_SIZE)
+
+
+def save_feedback(records):
+    """Upsert decisions in one transaction, then rerun the app with fresh aggregates."""
+    try:
+        with session_scope() as session:
+            counts = feedback.upsert_feedback(session, records)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return
+    # The feedback table always counts as changed, whatever else was committed
+    # meanwhile, so the rerun recomputes the feedback-dependent aggregates.
+    tracker.refresh(written=("clinician_feedback",))
+    st.session_state.feedback_saved = counts
+    st.rerun()
+
+
+def bulk_review(page, cursors):
+    """Editable grid for the current page; all decisions are saved together."""
+    grid = pd.DataFrame({
+        "Case": page["id"], "Date": page["created_at"], "Symptoms": page["preview"],
+        "Triage": page["triage"], "AI Scan": page["primary_modality"],
+        "Decision": pd.Series([None] * len(page), dtype="object"),
+        "Clinician Scan": page["primary_modality"], "Comment": "",
+    })
+    with st.form("bulk_review_form"):
+        edited = st.data_editor(
+            grid, hide_index=True, use_container_width=True,
+            disabled=["Case", "Date", "Symptoms", "Triage", "AI Scan"],
+            column_config={"Decision": st.column_config.SelectboxColumn(options=list(BULK_DECISIONS))},
+            key=f"bulk_grid_{len(cursors)}_{int(page['id'].iloc[0])}",
+        )
+        if st.form_submit_button("Save decisions"):
+            decided = edited[edited["Decision"].notna()]
+            if decided.empty:
+                st.warning("No decisions entered.")
+            else:
+                save_feedback([{
+                    "triage_log_id": row["Case"],
+                    "clinician_scan": row["Clinician Scan"] or row["AI Scan"],
+                    "accepted_recommendation": BULK_DECISIONS[row["Decision"]],
+                    "comment": row["Comment"],
+                } for _, row in decided.iterrows()])
+
+
+@st.fragment
+def feedback_form():
+    """Case picker and form; browsing and typing rerun only this fragment."""
+    saved = st.session_state.pop("feedback_saved", None)
+    if saved is not None:
+        st.success(f"✅ Saved {saved['inserted']} new and {saved['updated']} updated review(s).")
+
+    mode = st.radio("Mode", ["Single case", "Bulk review"], horizontal=True, key="review_mode")
+    f1, f2, f3, f4 = st.columns(4)
+    status = f1.selectbox("Show", queries.CASE_STATUSES, format_func=CASE_STATUS_LABELS.get)
+    triage_filter = f2.selectbox("Triage", ["All", queries.EMERGENCY, queries.NON_EMERGENCY])
+    modality_filter = f3.selectbox("AI Scan", ["All"] + query("modality_options"))
+    date_range = f4.date_input("Date range", value=())
+    filters = {
+        "status": status,
+        "triage": None if triage_filter == "All" else triage_filter,
+        "modality": None if modality_filter == "All" else modality_filter,
+        "start": date_range[0] if len(date_range) > 0 else None,
+        # The picker's end date is inclusive; the query window is half-open.
+        "end": date_range[1] + timedelta(days=1) if len(date_range) > 1 else None,
+    }
+    # Keyset cursors: one (created_at, id) per page visited; reset when the filters change.
+    if st.session_state.get("case_filters") != filters:
+        st.session_state.case_filters = filters
+        st.session_state.case_cursors = [None]
+    cursors = st.session_state.case_cursors
+    page = query("case_page", before=cursors[-1], limit=CASE_PAGE_SIZE, **filters)
+
+    if page.empty:
+        st.info("No cases match these filters.")
+    elif mode == "Bulk review":
+        bulk_review(page, cursors)
+        page_nav(page, cursors)
+    else:
+        labels = dict(zip(page["id"], (
+            page["id"].astype(str) + " | " + page["created_at"].astype(str) + " | " + page["preview"].fillna("")
+        )))
+        selected_id = int(st.selectbox("Select Case", options=page["id"].tolist(),
+                                       format_func=labels.get, key="triage_selector"))
+        page_nav(page, cursors)
+        selected_row = query("get_case", case_id=selected_id)
+
+        st.markdown(f"""
+        <div style="background: #1e3a5f; border-radius: 12px; padding: 20px; margin: 15px 0; border-left: 4px solid #f59e0b;">
+            <p style="color: #94a3b8; font-size: 12px; margin: 0;">AI RECOMMENDATION</p>
+            <p style="color: #f59e0b; font-size: 24px; font-weight: 700; margin: 5px 0;">{selected_row['primary_modality']}</p>
+            <p style="color: #64748b; margin: 0;">Priority: {selected_row['primary_priority']}</p>
+        </div>
+        """, unsafe_allow_html=True)
 
-    with st.form("feedback_form"):
-        clinician_scan = st.text_input("Your Decision", value=str(selected_row["primary_modality"] or ""))
-        accepted = st.radio("Accept AI?", ["✅ Yes", "❌ No"], horizontal=True)
-        comment = st.text_area("Notes (optional)")
+        with st.form("feedback_form"):
+            clinician_scan = st.text_input("Your Decision", value=str(selected_row["primary_modality"] or ""))
+            accepted = st.radio("Accept AI?", ["✅ Yes", "❌ No"], horizontal=True)
+            comment = st.text_area("Notes (optional)")
         
-        if st.form_submit_button(" Submit"):
-            try:
-                new_feedback = ClinicianFeedback(
-                    triage_log_id=selected_id,
-                    clinician_scan=clinician_scan,
-                    accepted_recommendation=accepted.startswith("✅"),
-                    comment=comment or None,
-                )
-                session.add(new_feedback)
-                session.commit()
-                st.success("✅ Saved! Refresh to see updates.")
-            except Exception as e:
-                session.rollback()
-                st.error(f"Error: {e}")
+            if st.form_submit_button(" Submit"):
+                save_feedback([{
+                    "triage_log_id": selected_id,
+                    "clinician_scan": clinician_scan,
+                    "accepted_recommendation": accepted.startswith("✅"),
+                    "comment": comment,
+                }])
+
+
+feedback_form()
 
 st.markdown("---")
 
 # ============================================
 # RECENT LOGS
 # ============================================
+profiler.section("Recent logs")
 st.header("Recent Triage Logs")
 
-recent = triage_df.sort_values("created_at", ascending=False).head(30)[[
-    'created_at', 'symptoms_text', 'age', 'sex', 'triage', 'primary_modality'
-]].copy()
+recent = windowed("recent_logs", limit=30)
 recent['triage'] = recent['triage'].apply(lambda x: f" {x}" if x == "URGENT_EMERGENCY" else f" {x}")
 recent.columns = ['Time', 'Symptoms', 'Age', 'Sex', 'Triage', 'Scan']
 st.dataframe(recent, use_container_width=True, hide_index=True)
 
+
+def export_cases():
+    # Built only when clicked; covers archived months as well as the database.
+    return read_range(engine, start=window_start, end=window_end).to_csv(index=False)
+
+
+st.download_button("Download cases in this window (CSV)", export_cases,
+                   file_name="skannr_cases.csv", mime="text/csv")
+
 # Footer
 st.markdown("---")
-st.markdown('<p style="text-align: center; color: #64748b;">Skannr AI | Dashboard v3.0</p>', unsafe_allow_html=True)
\ No newline at end of file
+st.markdown('<p style="text-align: center; color: #64748b;">Skannr AI | Dashboard v3.0</p>', unsafe_allow_html=True)
+show_profile()
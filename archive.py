@@ -0,0 +1,256 @@
+# archive.py
+"""
+Cold-storage tier: month-partitioned Parquet snapshots of old triage data.
+
+    python archive.py run --retention-days 365     # move old rows out, then VACUUM
+    python archive.py read --start 2024-01-01 --end 2024-04-01
+
+``archive()`` moves triage logs created before the start of the month that
+falls ``retention_days`` ago, together with their clinician feedback, into
+
+    <archive_dir>/triage_logs/month=YYYY-MM/part-<first id>-<last id>.parquet
+    <archive_dir>/clinician_feedback/month=YYYY-MM/part-<first id>-<last id>.parquet
+
+(zstd-compressed, dictionary-encoded strings), deletes them from SQLite and
+compacts the file. Feedback files carry the triage log's ``created_at``,
+``primary_modality`` and ``model_name`` so they can be filtered and analysed
+on their own.
+
+The rollup tables keep their counts for archived days (the rows' rollup
+contribution is added back after the delete), so the dashboard's KPIs and
+trends still cover the full history. Archived cases leave the full-text
+search index and the raw-row views (recent feedback, overrides).
+
+Files are written before anything is deleted and are named after the ids they
+hold, so re-running after a failure overwrites rather than duplicates.
+``data_loader.read_range`` reads both tiers through one interface.
+"""
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import column, select, table, text
+
+import migrations
+import rollups
+from database import engine as default_engine
+from models import TriageLog, ClinicianFeedback, ArchiveRun
+
+ARCHIVE_DIR = os.environ.get("SKANNR_ARCHIVE_DIR", "./archive")
+DEFAULT_RETENTION_DAYS = 365
+TABLES = ("triage_logs", "clinician_feedback")
+
+_archive_ids = select(column("id")).select_from(table("archive_ids"))
+TRIAGE_SELECT = select(TriageLog.__table__).where(TriageLog.id.in_(_archive_ids)).order_by(TriageLog.id)
+FEEDBACK_SELECT = (
+    select(ClinicianFeedback.id.label("id_fb"), ClinicianFeedback.triage_log_id,
+           ClinicianFeedback.clinician_scan, ClinicianFeedback.accepted_recommendation,
+           ClinicianFeedback.comment, TriageLog.created_at, TriageLog.primary_modality, TriageLog.model_name)
+    .join(TriageLog, TriageLog.id == ClinicianFeedback.triage_log_id)
+    .where(TriageLog.id.in_(_archive_ids)).order_by(ClinicianFeedback.id)
+)
+
+ROLLUP_RESTORE_SQL = [
+    "CREATE TEMP TABLE archive_triage_delta AS"
+    + rollups.TRIAGE_ROLLUP_SELECT.format(where="t.id IN (SELECT id FROM archive_ids)"),
+    "CREATE TEMP TABLE archive_agreement_delta AS"
+    + rollups.AGREEMENT_ROLLUP_SELECT.format(where="t.id IN (SELECT id FROM archive_ids)"),
+    "DELETE FROM clinician_feedback WHERE triage_log_id IN (SELECT id FROM archive_ids)",
+    "DELETE FROM triage_logs WHERE id IN (SELECT id FROM archive_ids)",
+    # The delete triggers took the rows' counts out of the rollups; put them back.
+    """INSERT INTO daily_triage_rollup (day, triage, primary_modality, model_name, cases)
+    SELECT * FROM archive_triage_delta WHERE true
+    ON CONFLICT (day, triage, primary_modality, model_name) DO UPDATE SET cases = cases + excluded.cases""",
+    """INSERT INTO agreement_rollup (day, ai_scan, clinician_scan, model_name, feedback, accepted, rejected)
+    SELECT * FROM archive_agreement_delta WHERE true
+    ON CONFLICT (day, ai_scan, clinician_scan, model_name)
+    DO UPDATE SET feedback = feedback + excluded.feedback, accepted = accepted + excluded.accepted,
+                  rejected = rejected + excluded.rejected""",
+    "DROP TABLE archive_triage_delta",
+    "DROP TABLE archive_agreement_delta",
+]
+
+
+def cutoff_for(retention_days, now=None):
+    """Start of the month containing ``now - retention_days``: whole months are archived."""
+    edge = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    return datetime(edge.year, edge.month, 1)
+
+
+# ============================================
+# WRITING
+# ============================================
+def _write_partition(df, archive_dir, table_name, month, first_id, last_id):
+    folder = os.path.join(archive_dir, table_name, f"month={month}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"part-{first_id}-{last_id}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp,
+                   compression="zstd", use_dictionary=True, write_statistics=True)
+    os.replace(tmp, path)
+    return path
+
+
+def _frame(conn, stmt):
+    result = conn.execute(stmt)
+    df = pd.DataFrame(result.all(), columns=list(result.keys()))
+    df["created_at"] = pd.to_datetime(df["created_at"])
+    return df
+
+
+def _month_rows(conn, bounds, month):
+    """Fill ``archive_ids`` with the month's triage logs; return (logs, feedback) frames."""
+    conn.execute(text("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)"))
+    conn.execute(text("DELETE FROM archive_ids"))
+    conn.execute(text(
+        "INSERT INTO archive_ids SELECT id FROM triage_logs "
+        "WHERE created_at < :cutoff AND strftime('%Y-%m', created_at) = :month"),
+        {**bounds, "month": month})
+    return _frame(conn, TRIAGE_SELECT), _frame(conn, FEEDBACK_SELECT)
+
+
+def _write_month(logs, feedback, archive_dir, month):
+    first, last = int(logs["id"].iloc[0]), int(logs["id"].iloc[-1])
+    files = [_write_partition(logs, archive_dir, "triage_logs", month, first, last)]
+    if not feedback.empty:
+        files.append(_write_partition(feedback, archive_dir, "clinician_feedback", month, first, last))
+    return files
+
+
+@contextmanager
+def _write_locked(engine):
+    """Connection in a ``BEGIN IMMEDIATE`` transaction, committed on success.
+
+    The write lock is taken before anything is read, so the transaction's
+    snapshot cannot go stale under a concurrent writer (which SQLite reports
+    as "database is locked" on the first write, whatever busy_timeout says).
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+
+def archive(engine=default_engine, retention_days=DEFAULT_RETENTION_DAYS, archive_dir=ARCHIVE_DIR,
+            vacuum=True, now=None):
+    """Move rows older than the retention window to Parquet; returns a summary dict.
+
+    Each month is read and written to Parquet without holding any lock, then
+    deleted in its own short ``BEGIN IMMEDIATE`` transaction that re-reads
+    the month first (and rewrites the files if ingest changed it meanwhile).
+    Writers therefore wait at most one month's delete, never the whole run.
+    """
+    migrations.upgrade(engine)
+    cutoff = cutoff_for(retention_days, now)
+    # created_at is stored as ISO text; compare against the same format.
+    bounds = {"cutoff": cutoff.isoformat(sep=" ")}
+    files, triage_rows, feedback_rows = [], 0, 0
+
+    with engine.connect() as conn:
+        months = conn.execute(text(
+            "SELECT DISTINCT strftime('%Y-%m', created_at) FROM triage_logs "
+            "WHERE created_at < :cutoff ORDER BY 1"), bounds).scalars().all()
+    for month in months:
+        with engine.connect() as conn:
+            logs, feedback = _month_rows(conn, bounds, month)
+        written = _write_month(logs, feedback, archive_dir, month) if not logs.empty else []
+        with _write_locked(engine) as conn:
+            fresh_logs, fresh_feedback = _month_rows(conn, bounds, month)
+            if not (fresh_logs.equals(logs) and fresh_feedback.equals(feedback)):
+                # Rows were added or changed since the snapshot: write what is deleted.
+                logs, feedback = fresh_logs, fresh_feedback
+                rewritten = _write_month(logs, feedback, archive_dir, month) if not logs.empty else []
+                for path in set(written) - set(rewritten):
+                    os.remove(path)
+                written = rewritten
+            for sql in ROLLUP_RESTORE_SQL:
+                conn.execute(text(sql))
+            conn.execute(text("DROP TABLE archive_ids"))
+        files += written
+        triage_rows += len(logs)
+        feedback_rows += len(feedback)
+
+    if months:
+        with engine.begin() as conn:
+            conn.execute(ArchiveRun.__table__.insert().values(
+                cutoff=cutoff, triage_rows=triage_rows, feedback_rows=feedback_rows))
+    if vacuum and months:
+        compact(engine)
+    return {"cutoff": cutoff, "months": months, "triage_rows": triage_rows,
+            "feedback_rows": feedback_rows, "files": files}
+
+
+def compact(engine=default_engine):
+    """VACUUM the database and truncate the WAL so freed pages go back to the OS."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+
+# ============================================
+# READING
+# ============================================
+def archive_cutoff(engine=default_engine):
+    """Rows created before this datetime may be in the archive (None if never archived)."""
+    with engine.connect() as conn:
+        return conn.execute(select(ArchiveRun.cutoff).order_by(ArchiveRun.cutoff.desc()).limit(1)).scalar()
+
+
+def read_archive(table_name, start=None, end=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """Archived rows of ``table_name`` with ``start <= created_at < end``.
+
+    Month partitions outside the range are skipped without being opened, and
+    row groups are pruned on their ``created_at`` statistics.
+    """
+    folder = os.path.join(archive_dir, table_name)
+    if not os.path.isdir(folder):
+        return None
+    dataset = ds.dataset(folder, format="parquet", partitioning="hive")
+    month, created = ds.field("month"), ds.field("created_at")
+    condition = None
+    if start is not None:
+        condition = (month >= f"{start:%Y-%m}") & (created >= pa.scalar(start, pa.timestamp("us")))
+    if end is not None:
+        upper = (month <= f"{end:%Y-%m}") & (created < pa.scalar(end, pa.timestamp("us")))
+        condition = upper if condition is None else condition & upper
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old triage data to Parquet and read it back.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run")
+    run.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS)
+    run.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    run.add_argument("--no-vacuum", action="store_true")
+    read = sub.add_parser("read")
+    read.add_argument("--table", choices=TABLES, default="triage_logs")
+    read.add_argument("--start", type=datetime.fromisoformat)
+    read.add_argument("--end", type=datetime.fromisoformat)
+    read.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = archive(retention_days=args.retention_days, archive_dir=args.archive_dir,
+                         vacuum=not args.no_vacuum)
+        print(f"archived {result['triage_rows']} triage logs and {result['feedback_rows']} feedback rows "
+              f"created before {result['cutoff']:%Y-%m-%d} into {len(result['files'])} files")
+        return 0
+    df = read_archive(args.table, args.start, args.end, archive_dir=args.archive_dir)
+    print("archive is empty" if df is None else df.to_string(index=False, max_rows=50))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# benchmark.py
+"""
+Benchmark suite for the dashboard's data path.
+
+    python benchmark.py --rows 10000 1000000 --output bench.json
+    python benchmark.py --rows 1000000 --compare bench.json   # exit 1 on regression
+
+For each size a synthetic database is generated (or reused from --db-dir)
+and every stage is timed on a plain run, then re-run under tracemalloc for
+its peak traced memory:
+
+    load_legacy         original ORM loader (sizes <= LEGACY_MAX_ROWS only)
+    load_columnar       data_loader.IncrementalLoader initial refresh
+    groupby_legacy      typical frame groupbys on the original loader's dtypes
+    groupby_compact     the same on the loader's categorical/nullable frames
+    aggregate_all_time  the dashboard's KPI / trend / distribution queries
+    aggregate_24h       the same over the data's last 24 hours (raw-row path)
+    heatmap_legacy      agreement matrix -> pivot -> one Plotly annotation per cell
+    heatmap             agreement matrix -> figures.agreement_heatmap (text matrix)
+    feedback_insert     one committed ClinicianFeedback per transaction
+    feedback_bulk       feedback.upsert_feedback: one transaction for a whole batch
+
+Generated data always ends at DATA_END, and the 24-hour window is taken
+from the data's newest row, so a database reused with --db-dir on a later
+day runs the same work and ``--compare`` stays meaningful.
+
+Each size also records ``frame_mb``: the in-memory size of the loaded frames
+in the compact schema and in the original one. Results are written as JSON
+so runs can be compared across versions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+import plotly.graph_objects as go
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import sessionmaker
+
+import feedback
+import figures
+import queries
+from database import make_engine, session_scope
+from data_loader import IncrementalLoader, frame_bytes
+from models import TriageLog, ClinicianFeedback
+from synthetic_data import SyntheticConfig, generate
+
+LEGACY_MAX_ROWS = 1_000_000
+FEEDBACK_INSERTS = 500
+FEEDBACK_BULK_ROWS = 10_000
+DATA_END = datetime(2025, 1, 1)
+
+
+# ============================================
+# STAGES
+# ============================================
+def legacy_load(engine):
+    """The dashboard's original loader, kept verbatim for comparison."""
+    session = sessionmaker(bind=engine)()
+    triage_logs = session.query(TriageLog).all()
+    triage_df = pd.DataFrame([{
+        "id": t.id, "created_at": t.created_at, "symptoms_text": t.symptoms_text,
+        "age": t.age, "sex": t.sex, "pregnancy": t.pregnancy, "implants": t.implants,
+        "location": t.location, "triage": t.triage, "primary_modality": t.primary_modality,
+        "primary_priority": t.primary_priority, "model_name": t.model_name
+    } for t in triage_logs])
+    triage_df['created_at'] = pd.to_datetime(triage_df['created_at'])
+    triage_df['date'] = triage_df['created_at'].dt.date
+    feedback_logs = (
+        session.query(ClinicianFeedback, TriageLog)
+        .join(TriageLog, ClinicianFeedback.triage_log_id == TriageLog.id)
+        .order_by(ClinicianFeedback.id.desc()).all()
+    )
+    feedback_df = pd.DataFrame([{
+        "id_fb": fb.id, "triage_log_id": tl.id, "clinician_scan": fb.clinician_scan,
+        "accepted_recommendation": fb.accepted_recommendation, "comment": fb.comment,
+        "created_at": tl.created_at, "primary_modality": tl.primary_modality, "symptoms_text": tl.symptoms_text,
+    } for fb, tl in feedback_logs])
+    feedback_df['created_at'] = pd.to_datetime(feedback_df['created_at'])
+    session.close()
+    return triage_df, feedback_df
+
+
+def columnar_load(engine):
+    loader = IncrementalLoader(engine, max_rows=10**9)
+    loader.refresh()
+    loader.close()
+    return loader.triage_df, loader.feedback_df
+
+
+def legacy_dtypes(df):
+    """``df`` with the dtypes the original loader produced: object strings, float age, object dates."""
+    out = df.copy()
+    for name, dtype in out.dtypes.items():
+        if isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype)) or name == "pregnancy":
+            out[name] = out[name].astype(object).where(out[name].notna(), None)
+    if "age" in out:
+        out["age"] = out["age"].astype("float64")
+    if "accepted_recommendation" in out:
+        out["accepted_recommendation"] = out["accepted_recommendation"].astype(bool)
+    if "date" in out:
+        out["date"] = out["created_at"].dt.date
+    return out
+
+
+def frame_groupbys(triage_df, feedback_df):
+    """The kind of value_counts/groupby work done on the cached frames."""
+    return [
+        triage_df["triage"].value_counts(),
+        triage_df["primary_modality"].value_counts(),
+        triage_df.groupby(["date", "triage"], observed=True).size(),
+        triage_df.groupby("model_name", observed=True)["age"].mean(),
+        feedback_df.groupby("primary_modality", observed=True)["accepted_recommendation"].mean(),
+        feedback_df.groupby(["primary_modality", "clinician_scan"], observed=True).size(),
+    ]
+
+
+def aggregate(factory, start=None, end=None):
+    with session_scope(factory) as s:
+        window = {"start": start, "end": end}
+        return [
+            queries.kpi_totals(s, **window),
+            queries.volume_series(s, granularity="hour" if start else "week", **window),
+            queries.triage_distribution(s, **window),
+            queries.scan_distribution(s, **window),
+            queries.agreement_by_modality(s, **window),
+            queries.top_overridden(s, "ai_scan", **window),
+        ]
+
+
+def heatmap_legacy(factory):
+    """Agreement heatmap as the dashboard used to build it."""
+    with session_scope(factory) as s:
+        comparison = queries.agreement_matrix(s)
+    pivot = comparison.pivot(index="AI Scan", columns="Clinician Scan", values="Count").fillna(0)
+    fig = go.Figure(data=go.Heatmap(z=pivot.values, x=pivot.columns, y=pivot.index))
+    for i, row in enumerate(pivot.index):
+        for j, col in enumerate(pivot.columns):
+            val = pivot.iloc[i, j]
+            if val > 0:
+                fig.add_annotation(x=col, y=row, text=str(int(val)), showarrow=False)
+    return fig.to_plotly_json()
+
+
+def heatmap(factory):
+    """Agreement heatmap as the dashboard builds it (before the figure cache)."""
+    with session_scope(factory) as s:
+        comparison = figures.normalize_scans(queries.agreement_matrix(s))
+    return figures.agreement_heatmap(comparison).to_plotly_json()
+
+
+def feedback_insert(factory):
+    """Insert FEEDBACK_INSERTS feedback rows the way the form does, then remove them."""
+    with session_scope(factory) as s:
+        pending = queries.case_page(s, status="pending", limit=FEEDBACK_INSERTS)["id"].tolist()
+    start = time.perf_counter()
+    for case_id in pending:
+        with session_scope(factory) as s:
+            s.add(ClinicianFeedback(triage_log_id=case_id, clinician_scan="CT head",
+                                    accepted_recommendation=True))
+    written = time.perf_counter() - start
+    with session_scope(factory) as s:
+        s.execute(delete(ClinicianFeedback).where(ClinicianFeedback.triage_log_id.in_(pending)))
+    return len(pending), written
+
+
+def feedback_bulk(factory):
+    """Upsert FEEDBACK_BULK_ROWS decisions in one transaction, then remove them."""
+    with session_scope(factory) as s:
+        pending = queries.case_page(s, status="pending", limit=FEEDBACK_BULK_ROWS)["id"].tolist()
+    records = [{"triage_log_id": case_id, "clinician_scan": "CT head", "accepted_recommendation": i % 5 != 0}
+               for i, case_id in enumerate(pending)]
+    start = time.perf_counter()
+    with session_scope(factory) as s:
+        feedback.upsert_feedback(s, records)
+    written = time.perf_counter() - start
+    with session_scope(factory) as s:
+        s.execute(delete(ClinicianFeedback).where(ClinicianFeedback.triage_log_id.in_(pending)))
+    return len(pending), written
+
+
+def measure(fn, *args):
+    """Wall time of a plain run, then peak traced memory of a second run."""
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = {"seconds": round(elapsed, 4), "peak_mb": round(peak / 2**20, 2)}
+    if fn in (feedback_insert, feedback_bulk):  # (rows, seconds spent writing them)
+        rows, written = result
+        stats["rows_per_second"] = round(rows / written, 1)
+    return stats
+
+
+# ============================================
+# SUITE
+# ============================================
+def _database(rows, db_dir):
+    path = os.path.join(db_dir, f"synthetic_{rows}.db")
+    generated = None
+    if not os.path.exists(path):
+        engine = make_engine(f"sqlite:///{path}")
+        start = time.perf_counter()
+        generate(engine, SyntheticConfig(rows=rows, end=DATA_END))
+        generated = round(time.perf_counter() - start, 2)
+        engine.dispose()
+    return path, generated
+
+
+def run_size(rows, db_dir):
+    path, generated = _database(rows, db_dir)
+    engine = make_engine(f"sqlite:///{path}")
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_scope(factory) as s:
+        # Just past the newest row, so that row falls inside the 24-hour window.
+        now = s.execute(select(func.max(TriageLog.created_at))).scalar() + timedelta(seconds=1)
+
+    stages = {}
+    if rows <= LEGACY_MAX_ROWS:
+        stages["load_legacy"] = measure(legacy_load, engine)
+    stages["load_columnar"] = measure(columnar_load, engine)
+    compact = columnar_load(engine)
+    legacy = tuple(legacy_dtypes(df) for df in compact)
+    stages["groupby_legacy"] = measure(frame_groupbys, *legacy)
+    stages["groupby_compact"] = measure(frame_groupbys, *compact)
+    frame_mb = {name: round(sum(frame_bytes(df) for df in frames) / 2**20, 1)
+                for name, frames in (("legacy", legacy), ("compact", compact))}
+    del compact, legacy
+    stages["aggregate_all_time"] = measure(aggregate, factory)
+    stages["aggregate_24h"] = measure(aggregate, factory, now - timedelta(hours=24), now)
+    stages["heatmap_legacy"] = measure(heatmap_legacy, factory)
+    stages["heatmap"] = measure(heatmap, factory)
+    stages["feedback_insert"] = measure(feedback_insert, factory)
+    stages["feedback_bulk"] = measure(feedback_bulk, factory)
+    engine.dispose()
+    result = {"stages": stages, "frame_mb": frame_mb}
+    if generated is not None:
+        result["generate_seconds"] = generated
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Return stage timings that got slower than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for rows, result in current["sizes"].items():
+        for stage, stats in result["stages"].items():
+            before = baseline.get("sizes", {}).get(rows, {}).get("stages", {}).get(stage)
+            if before and stats["seconds"] > before["seconds"] * (1 + tolerance):
+                regressions.append(f"{rows} rows / {stage}: {before['seconds']}s -> {stats['seconds']}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard data path.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--db-dir", help="reuse/keep generated databases here (default: temporary)")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (default 25%%)")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pandas": pd.__version__,
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        db_dir = args.db_dir or tmp
+        os.makedirs(db_dir, exist_ok=True)
+        for rows in args.rows:
+            result = run_size(rows, db_dir)
+            report["sizes"][str(rows)] = result
+            print(f"rows={rows:,}  frames: {result['frame_mb']['legacy']} MB legacy dtypes, "
+                  f"{result['frame_mb']['compact']} MB compact")
+            for stage, stats in result["stages"].items():
+                extra = f"  {stats['rows_per_second']:,.0f} rows/s" if "rows_per_second" in stats else ""
+                print(f"  {stage:<20}{stats['seconds']:>9.3f}s  peak {stats['peak_mb']:>8.1f} MB{extra}")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
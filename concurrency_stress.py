@@ -0,0 +1,109 @@
+# concurrency_stress.py
+"""
+Concurrency stress test for the SQLite engine configuration.
+
+    python concurrency_stress.py --writers 4 --readers 8 --seconds 10
+
+Runs ingest-style writer threads (one triage log, sometimes followed by
+feedback, per transaction) against dashboard-style reader threads (KPI
+queries and incremental loader refreshes) on a throwaway database built
+with ``database.make_engine``. Exits non-zero if any operation failed,
+e.g. with "database is locked".
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+import queries
+import rollups
+from database import Base, make_engine, session_scope
+from data_loader import IncrementalLoader
+from models import TriageLog, ClinicianFeedback
+
+
+def _first_line(exc):
+    return f"{type(exc).__name__}: {str(exc).splitlines()[0] if str(exc) else ''}"
+
+
+def writer(factory, stop, stats, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            with session_scope(factory) as session:
+                log = TriageLog(
+                    created_at=datetime.utcnow(), symptoms_text="stress test",
+                    triage=rng.choice(["URGENT_EMERGENCY", "NON_EMERGENCY"]),
+                    primary_modality=rng.choice(["CT head", "MRI brain", "Chest X-ray"]),
+                )
+                session.add(log)
+                if rng.random() < 0.3:
+                    session.flush()
+                    session.add(ClinicianFeedback(triage_log_id=log.id, clinician_scan="CT head",
+                                                  accepted_recommendation=rng.random() < 0.8))
+            stats["writes"] += 1
+        except Exception as e:
+            stats[f"write error: {_first_line(e)}"] += 1
+
+
+def reader(factory, loader, stop, stats):
+    while not stop.is_set():
+        try:
+            with session_scope(factory) as session:
+                queries.kpi_totals(session)
+                queries.agreement_matrix(session)
+            loader.refresh()
+            stats["reads"] += 1
+        except Exception as e:
+            stats[f"read error: {_first_line(e)}"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'stress.db')}")
+        Base.metadata.create_all(engine)
+        rollups.ensure_rollups(engine)
+        factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        loader = IncrementalLoader(engine)
+
+        stop = threading.Event()
+        stats = Counter()  # += on Counter is not atomic, but counts are only indicative
+        threads = [threading.Thread(target=writer, args=(factory, stop, stats, i)) for i in range(args.writers)]
+        threads += [threading.Thread(target=reader, args=(factory, loader, stop, stats)) for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        with session_scope(factory) as session:
+            totals = queries.kpi_totals(session)
+        loader.close()
+        engine.dispose()
+
+    errors = {k: v for k, v in stats.items() if "error" in k}
+    print(f"writes={stats['writes']} ({stats['writes'] / args.seconds:.0f}/s)  "
+          f"reads={stats['reads']} ({stats['reads'] / args.seconds:.0f}/s)  "
+          f"rows={totals['total_cases']}")
+    for message, count in errors.items():
+        print(f"  {count}x {message}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+# data_loader.py
+"""
+Change detection and an incremental, in-memory cache of the triage and
+feedback tables.
+
+``ChangeTracker.refresh()`` first asks SQLite whether anything was committed
+since the last call (``PRAGMA data_version`` on a dedicated connection); only
+then does it look at ``MAX(id)``/``COUNT(*)``. A rerun with no new data
+therefore costs one tiny query. The dashboard shares one tracker across
+sessions and keys its cached aggregates on ``table_versions``.
+``IncrementalLoader`` adds typed frames that fetch only the rows past the
+high-water marks, for offline analysis and benchmarks.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import and_, select, func, true, String, type_coerce
+
+from models import TriageLog, ClinicianFeedback, ArchiveRun, TableChanges
+
+# Large free-text columns (symptoms_text, comment) are deliberately absent;
+# views that show them query just the rows on screen (see queries.py).
+TRIAGE_COLUMNS = [
+    "id", "created_at", "age", "sex", "pregnancy", "implants",
+    "location", "triage", "primary_modality", "primary_priority", "model_name",
+]
+FEEDBACK_COLUMNS = [
+    "id_fb", "triage_log_id", "clinician_scan", "accepted_recommendation",
+    "created_at", "primary_modality",
+]
+
+# Result column name -> (SQL expression, pandas dtype). Low-cardinality
+# strings are categorical (one small code per row instead of a Python str),
+# age and flags are nullable small ints/booleans, timestamps are datetime64.
+COLUMN_SOURCES = {
+    "id": (TriageLog.id, "int64"),
+    "created_at": (type_coerce(TriageLog.created_at, String), "datetime64[ns]"),
+    "age": (TriageLog.age, "Int16"),
+    "sex": (TriageLog.sex, "category"),
+    "pregnancy": (TriageLog.pregnancy, "boolean"),
+    "implants": (TriageLog.implants, "string"),
+    "location": (TriageLog.location, "category"),
+    "triage": (TriageLog.triage, "category"),
+    "primary_modality": (TriageLog.primary_modality, "category"),
+    "primary_priority": (TriageLog.primary_priority, "category"),
+    "model_name": (TriageLog.model_name, "category"),
+    "id_fb": (ClinicianFeedback.id, "int64"),
+    "triage_log_id": (ClinicianFeedback.triage_log_id, "int64"),
+    "clinician_scan": (ClinicianFeedback.clinician_scan, "category"),
+    "accepted_recommendation": (ClinicianFeedback.accepted_recommendation, "boolean"),
+}
+
+DEFAULT_MAX_ROWS = 200_000
+DEFAULT_MAX_BYTES = 256 * 2**20  # per frame
+CHUNK_SIZE = 50_000
+
+
+def _typed(values, dtype):
+    if dtype == "datetime64[ns]":
+        return pd.to_datetime(pd.Series(values, dtype="object"), format="ISO8601")
+    if dtype == "Int16":
+        # Free-input integers: a typo or sentinel outside the range becomes NA
+        # instead of failing the whole load with OverflowError.
+        info = np.iinfo(np.int16)
+        numbers = pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce")
+        return numbers.where(numbers.between(info.min, info.max)).astype(dtype)
+    return pd.Series(values, dtype=dtype)
+
+
+def _same_category_dtype(parts):
+    """Give every categorical Series in ``parts`` categories of one dtype.
+
+    ``union_categoricals`` rejects mixed category dtypes. A chunk whose
+    column is all NULL (say, new cases without sex or location) has empty
+    object categories, and Parquet reads can differ from the SQLite chunks.
+    """
+    ref = next((p.cat.categories.dtype for p in parts if len(p.cat.categories)), object)
+    return [p if p.cat.categories.dtype == ref
+            else p.cat.rename_categories(p.cat.categories.astype(ref)) for p in parts]
+
+
+def concat_frames(frames):
+    """``pd.concat`` that keeps categorical columns categorical.
+
+    Plain concat falls back to object dtype when chunks have different
+    categories; here each categorical column is rebuilt over the union.
+    """
+    frames = [f for f in frames if not f.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    out = pd.concat(frames, ignore_index=True)
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            parts = _same_category_dtype([f[name] for f in frames])
+            out[name] = union_categoricals(parts, ignore_order=True)
+    return out
+
+
+def frame_bytes(df):
+    """Memory held by ``df``, including the Python strings of object columns."""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def read_frame(conn, columns, where=None, join_feedback=False, order_by=None, chunk_size=CHUNK_SIZE,
+               trim=None):
+    """Stream a Core ``select()`` of ``columns`` into a typed DataFrame.
+
+    Rows are pulled ``chunk_size`` at a time and each chunk is converted to
+    typed columns straight away, so at most one chunk of Python tuples is
+    alive at once and no ORM objects are built. ``trim``, if given, is
+    applied to the accumulated frame after every chunk (e.g. to drop the
+    oldest rows), so peak memory stays within its bound plus one chunk.
+    """
+    exprs = [COLUMN_SOURCES[c][0] for c in columns]
+    stmt = select(*exprs)
+    if join_feedback:
+        stmt = stmt.select_from(ClinicianFeedback).join(
+            TriageLog, ClinicianFeedback.triage_log_id == TriageLog.id)
+    if where is not None:
+        stmt = stmt.where(where)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+
+    result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+    parts = []
+    for rows in result.partitions():
+        cols = list(zip(*rows))
+        parts.append(pd.DataFrame({
+            name: _typed(values, COLUMN_SOURCES[name][1]).values
+            for name, values in zip(columns, cols)
+        }))
+        if trim is not None:
+            parts = [trim(concat_frames(parts))]
+    if not parts:
+        return pd.DataFrame({c: pd.Series(dtype=COLUMN_SOURCES[c][1]) for c in columns})
+    return concat_frames(parts)
+
+
+def read_range(engine, table_name="triage_logs", start=None, end=None, columns=None, archive_dir=None):
+    """Rows of ``table_name`` with ``start <= created_at < end`` from both storage tiers.
+
+    Recent rows come from SQLite. When the range reaches back before the last
+    archive cutoff, older rows are read from the Parquet archive (archive.py,
+    which needs pyarrow) with month-partition pruning. Either way the result
+    has the loader's column names and dtypes.
+    """
+    feedback = table_name == "clinician_feedback"
+    columns = list(columns or (FEEDBACK_COLUMNS if feedback else TRIAGE_COLUMNS))
+    key = "id_fb" if feedback else "id"
+    bounds = [c for c in (start is not None and TriageLog.created_at >= start,
+                          end is not None and TriageLog.created_at < end) if c is not False]
+    with engine.connect() as conn:
+        cutoff = conn.execute(select(func.max(ArchiveRun.cutoff))).scalar()
+        hot = read_frame(conn, columns, where=and_(true(), *bounds), join_feedback=feedback,
+                         order_by=COLUMN_SOURCES[key][0])
+    if cutoff is None or (start is not None and start >= cutoff):
+        return hot
+
+    import archive
+    cold = archive.read_archive(table_name, start, cutoff if end is None else min(end, cutoff),
+                                columns=columns, archive_dir=archive_dir or archive.ARCHIVE_DIR)
+    if cold is None or cold.empty:
+        return hot
+    # A re-run after an interrupted archive job can leave rows in both tiers.
+    cold = cold[~cold[key].isin(hot[key])]
+    cold = pd.DataFrame({c: cold[c].astype(COLUMN_SOURCES[c][1]) for c in columns})
+    return concat_frames([cold.sort_values(key, ignore_index=True), hot])
+
+
+class ChangeTracker:
+    """Notices committed changes to the triage and feedback tables without loading them.
+
+    ``refresh()`` first asks SQLite whether anything was committed since the
+    last call (``PRAGMA data_version``); only then does it read each table's
+    ``MAX(id)``/``COUNT(*)`` and the change counter its triggers keep (see
+    rollups.py, which must be installed). ``version`` moves on any change;
+    ``table_versions`` moves per table, also for updates, so caches can keep
+    results that only read the unchanged table.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.version = 0
+        self.table_versions = {"triage_logs": 0, "clinician_feedback": 0}
+        self._data_version = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._watch_conn = None
+
+    def _poll_data_version(self):
+        """Return SQLite's data_version, or None on other backends.
+
+        The pragma only moves when *another* connection commits, so it is read
+        from a connection the tracker holds on to and never writes with.
+        """
+        if self.engine.dialect.name != "sqlite":
+            return None
+        if self._watch_conn is None:
+            self._watch_conn = self.engine.raw_connection()
+        cur = self._watch_conn.cursor()
+        try:
+            return cur.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            cur.close()
+
+    def _table_signature(self, conn):
+        """{table: (MAX(id), COUNT(*), change counter)} for both tables."""
+        def part(model, name):
+            changes = select(TableChanges.changes).where(TableChanges.table_name == name)
+            return [select(func.max(model.id)).scalar_subquery(),
+                    select(func.count(model.id)).scalar_subquery(),
+                    func.coalesce(changes.scalar_subquery(), 0)]
+
+        row = conn.execute(select(*part(TriageLog, "triage_logs"),
+                                  *part(ClinicianFeedback, "clinician_feedback"))).one()
+        return {"triage_logs": tuple(row[:3]), "clinician_feedback": tuple(row[3:])}
+
+    def _load(self, conn, signature):
+        """Hook for subclasses to fetch rows before the versions move."""
+
+    def refresh(self, written=()):
+        """Check for committed changes. Returns True if anything changed.
+
+        ``written`` names tables the caller has just written to; they are
+        marked changed whatever the signature says.
+        """
+        with self._lock:
+            data_version = self._poll_data_version()
+            if not written and data_version is not None and data_version == self._data_version:
+                return False
+
+            with self.engine.connect() as conn:
+                signature = self._table_signature(conn)
+                changed = {
+                    table: table in written or self._signature is None
+                    or part != self._signature[table]
+                    for table, part in signature.items()
+                }
+                if any(changed.values()):
+                    self._load(conn, signature)
+
+            self._data_version = data_version
+            self._signature = signature
+            for table, moved in changed.items():
+                if moved:
+                    self.table_versions[table] += 1
+            if any(changed.values()):
+                self.version += 1
+            return any(changed.values())
+
+    def close(self):
+        if self._watch_conn is not None:
+            self._watch_conn.close()
+            self._watch_conn = None
+
+
+class IncrementalLoader(ChangeTracker):
+    """Keeps ``triage_df``/``feedback_df`` up to date with the database.
+
+    Frames are ordered by id ascending and bounded to ``max_rows`` rows and
+    ``max_bytes`` of memory each. A load from scratch starts at the newest
+    ``max_rows`` ids, and the oldest rows are evicted chunk by chunk as they
+    arrive, so peak memory stays near the bound rather than the table size.
+    Change detection and versions work as in ``ChangeTracker``; only the rows
+    past the high-water marks are fetched.
+    """
+
+    def __init__(self, engine, max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES,
+                 triage_columns=TRIAGE_COLUMNS, feedback_columns=FEEDBACK_COLUMNS):
+        super().__init__(engine)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.triage_columns = list(triage_columns)
+        self.feedback_columns = list(feedback_columns)
+        self.triage_df = pd.DataFrame(columns=self.triage_columns)
+        self.feedback_df = pd.DataFrame(columns=self.feedback_columns)
+        self._triage_hwm = 0
+        self._feedback_hwm = 0
+
+    # ----------------------------------------
+    # Fetching
+    # ----------------------------------------
+    def _floor_id(self, conn, key, after_id, upto):
+        """Id just below the newest ``max_rows`` rows in ``(after_id, upto]``.
+
+        Rows older than that would be evicted straight away, so the first
+        load (and a reload from scratch) never reads them.
+        """
+        floor = conn.execute(
+            select(key).where(key > after_id, key <= upto).order_by(key.desc()).offset(self.max_rows).limit(1)
+        ).scalar()
+        return after_id if floor is None else floor
+
+    def _fetch_triage(self, conn, after_id, upto):
+        after_id = self._floor_id(conn, TriageLog.id, after_id, upto)
+        df = read_frame(conn, self.triage_columns, where=and_(TriageLog.id > after_id, TriageLog.id <= upto),
+                        order_by=TriageLog.id, chunk_size=min(CHUNK_SIZE, self.max_rows), trim=self._trim)
+        if "created_at" in df:
+            df["date"] = df["created_at"].dt.normalize()
+        return df
+
+    def _fetch_feedback(self, conn, after_id, upto):
+        after_id = self._floor_id(conn, ClinicianFeedback.id, after_id, upto)
+        return read_frame(conn, self.feedback_columns,
+                          where=and_(ClinicianFeedback.id > after_id, ClinicianFeedback.id <= upto),
+                          join_feedback=True, order_by=ClinicianFeedback.id,
+                          chunk_size=min(CHUNK_SIZE, self.max_rows), trim=self._trim)
+
+    def _trim(self, df):
+        """Evict the oldest rows of ``df`` past ``max_rows`` or ``max_bytes``."""
+        if df.empty:
+            return df
+        limit = self.max_rows
+        if self.max_bytes is not None:
+            per_row = frame_bytes(df) / len(df)
+            limit = min(limit, int(self.max_bytes // per_row))
+        if len(df) > limit:
+            df = df.iloc[len(df) - limit:].reset_index(drop=True)
+        return df
+
+    def _append(self, current, new):
+        if new.empty:
+            return current
+        return self._trim(new if current.empty else concat_frames([current, new]))
+
+    def _only_appended(self, table, signature):
+        """True if ``table`` only gained rows since the last refresh.
+
+        Every insert adds one to both COUNT(*) and the change counter; an
+        update or delete moves the counter alone (or the count down).
+        """
+        if self._signature is None:
+            return True
+        _, old_count, old_changes = self._signature[table]
+        _, count, changes = signature[table]
+        return count - old_count == changes - old_changes
+
+    def _load(self, conn, signature):
+        # Fetches stop at the MAX(id) read with the signature, so a row
+        # committed meanwhile is left for the next refresh instead of being
+        # fetched now and again then.
+        triage_max = signature["triage_logs"][0] or 0
+        feedback_max = signature["clinician_feedback"][0] or 0
+
+        # Rows carry no modification time: after an update or delete, start over.
+        if not self._only_appended("triage_logs", signature):
+            self._triage_hwm, self.triage_df = 0, self.triage_df.iloc[0:0]
+        if not self._only_appended("clinician_feedback", signature):
+            self._feedback_hwm, self.feedback_df = 0, self.feedback_df.iloc[0:0]
+        new_triage = self._fetch_triage(conn, self._triage_hwm, triage_max)
+        new_feedback = self._fetch_feedback(conn, self._feedback_hwm, feedback_max)
+
+        self.triage_df = self._append(self.triage_df, new_triage)
+        self.feedback_df = self._append(self.feedback_df, new_feedback)
+        self._triage_hwm = max(self._triage_hwm, triage_max)
+        self._feedback_hwm = max(self._feedback_hwm, feedback_max)
+
+    # ----------------------------------------
+    # Public API
+    # ----------------------------------------
+    def memory_usage(self):
+        """Bytes held by each cached frame."""
+        return {"triage_df": frame_bytes(self.triage_df), "feedback_df": frame_bytes(self.feedback_df)}
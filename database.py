@@ -1,14 +1,71 @@
 # database.py
-from sqlalchemy import create_engine
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+
+DATABASE_URL = os.environ.get("SKANNR_DATABASE_URL", "sqlite:///./skannr_ai.db")  # file in backend folder
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer; busy_timeout makes a writer wait for the lock instead of
+# failing with "database is locked"; synchronous=NORMAL is durable in WAL mode
+# apart from the last transactions on power loss.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "busy_timeout": 10_000,        # ms
+    "synchronous": "NORMAL",
+    "cache_size": -64_000,         # KiB (negative = size, not pages)
+    "temp_store": "MEMORY",
+}
+
+
+def make_engine(url=DATABASE_URL, pool_size=10, max_overflow=20, pool_timeout=30, pragmas=None):
+    """Create an engine; SQLite URLs get the pragmas above and a real connection pool."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                             pool_timeout=pool_timeout, pool_pre_ping=True)
 
-DATABASE_URL = "sqlite:///./skannr_ai.db"  # file in backend folder
+    settings = {**SQLITE_PRAGMAS, **(pragmas or {})}
+    engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,  # needed for SQLite + FastAPI
+            "timeout": settings["busy_timeout"] / 1000,
+        },
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # needed for SQLite + FastAPI
-)
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+engine = make_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+@contextmanager
+def session_scope(factory=SessionLocal):
+    """Yield a short-lived session; commit on success, roll back on error."""
+    session = factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,164 @@
+# feedback.py
+"""
+Batched clinician feedback writes and bulk import.
+
+    python feedback.py import reviews.csv
+    python feedback.py import reviews.jsonl --format jsonl
+
+Every write is an ``INSERT ... ON CONFLICT(triage_log_id) DO UPDATE``, so
+re-reviewing a case replaces its feedback instead of failing on the unique
+constraint, and a whole batch goes to the database as one executemany in a
+single transaction. The rollup and search triggers handle both the insert
+and the update path.
+
+Import files need ``triage_log_id`` and ``accepted_recommendation`` columns
+(true/false, yes/no or 1/0); ``clinician_scan`` and ``comment`` are optional,
+as not every case has a scan recommendation to confirm or override.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import migrations
+from database import SessionLocal, session_scope
+from models import TriageLog, ClinicianFeedback
+
+FIELDS = ["triage_log_id", "clinician_scan", "accepted_recommendation", "comment"]
+REQUIRED = ["triage_log_id", "accepted_recommendation"]
+UPSERT_BATCH = 5_000
+IN_CLAUSE_BATCH = 500
+
+_TRUE = {"true", "t", "yes", "y", "1", "accepted", "accept"}
+_FALSE = {"false", "f", "no", "n", "0", "rejected", "reject", "override"}
+_DIALECTS = {"sqlite": sqlite, "postgresql": postgresql}
+
+
+def _parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    key = str(value).strip().lower()
+    if key in _TRUE:
+        return True
+    if key in _FALSE:
+        return False
+    raise ValueError(f"not a yes/no value: {value!r}")
+
+
+def _text_or_none(value):
+    """Stripped text, or None for missing values (None/NaN) and blanks."""
+    return None if pd.isna(value) or not str(value).strip() else str(value).strip()
+
+
+def normalize(records):
+    """Validate and clean feedback dicts; raises ValueError naming the bad row."""
+    out = []
+    for n, rec in enumerate(records, start=1):
+        missing = [f for f in REQUIRED if pd.isna(rec.get(f))]
+        if missing:
+            raise ValueError(f"row {n}: missing {', '.join(missing)}")
+        try:
+            accepted = _parse_bool(rec["accepted_recommendation"])
+            triage_log_id = int(rec["triage_log_id"])
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"row {n}: {e}") from None
+        out.append({
+            "triage_log_id": triage_log_id,
+            "clinician_scan": _text_or_none(rec.get("clinician_scan")),
+            "accepted_recommendation": accepted,
+            "comment": _text_or_none(rec.get("comment")),
+        })
+    return out
+
+
+def _existing(session, column, ids):
+    found = set()
+    for start in range(0, len(ids), IN_CLAUSE_BATCH):
+        batch = ids[start:start + IN_CLAUSE_BATCH]
+        found.update(session.execute(select(column).where(column.in_(batch))).scalars())
+    return found
+
+
+def upsert_feedback(session, records):
+    """Insert or update feedback for many cases in the session's transaction.
+
+    Rows for unknown triage logs are skipped. Returns a dict with the number
+    of rows ``inserted``, ``updated`` and ``skipped``.
+    """
+    records = normalize(records)
+    # The last decision for a case wins, as it would with one write per row.
+    by_case = {r["triage_log_id"]: r for r in records}
+    ids = list(by_case)
+    known = _existing(session, TriageLog.id, ids)
+    reviewed = _existing(session, ClinicianFeedback.triage_log_id, ids)
+    rows = [r for case_id, r in by_case.items() if case_id in known]
+
+    insert = _DIALECTS[session.get_bind().dialect.name].insert
+    stmt = insert(ClinicianFeedback)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ClinicianFeedback.triage_log_id],
+        set_={f: stmt.excluded[f] for f in FIELDS[1:]},
+    )
+    for start in range(0, len(rows), UPSERT_BATCH):
+        session.execute(stmt, rows[start:start + UPSERT_BATCH])
+    updated = len(reviewed & known)
+    return {"inserted": len(rows) - updated, "updated": updated, "skipped": len(records) - len(rows)}
+
+
+def read_feedback_file(path_or_buffer, fmt=None):
+    """Read a CSV or JSONL feedback file into a list of dicts."""
+    if fmt is None:
+        name = getattr(path_or_buffer, "name", path_or_buffer)
+        fmt = "jsonl" if str(name).lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+    if fmt == "jsonl":
+        df = pd.read_json(path_or_buffer, lines=True, dtype=False)
+    elif fmt == "csv":
+        df = pd.read_csv(path_or_buffer, dtype=str, keep_default_na=False, na_values=[""])
+    else:
+        raise ValueError(f"unknown format {fmt!r} (expected csv or jsonl)")
+    missing = [f for f in REQUIRED if f not in df.columns]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    return df.reindex(columns=FIELDS).to_dict("records")
+
+
+def import_feedback(path_or_buffer, fmt=None, factory=SessionLocal):
+    """Upsert every row of a CSV/JSONL file in one transaction; returns counts and rows/s."""
+    records = read_feedback_file(path_or_buffer, fmt)
+    started = time.perf_counter()
+    with session_scope(factory) as session:
+        counts = upsert_feedback(session, records)
+    elapsed = time.perf_counter() - started
+    return {**counts, "seconds": round(elapsed, 3), "rows_per_second": round(len(records) / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import clinician feedback.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    migrations.upgrade()  # triggers must exist so rollups and search see the rows
+    try:
+        result = import_feedback(args.path, args.format)
+    except ValueError as e:
+        print(f"import failed: {e}")
+        return 1
+    print(f"inserted={result['inserted']} updated={result['updated']} skipped={result['skipped']} "
+          f"in {result['seconds']}s ({result['rows_per_second']:,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
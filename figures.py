@@ -0,0 +1,276 @@
+# figures.py
+"""
+Plotly figures for the analytics dashboard, and a memoized figure layer.
+
+Every builder takes the small aggregate frames returned by queries.py and
+returns a ``go.Figure``. ``FigureCache.get(builder, *args)`` keys each figure
+by the builder and a fingerprint of its inputs, so a rerun over unchanged
+aggregates reuses the figure built last time instead of building it again:
+
+    cache = FigureCache(max_entries=128)
+    st.plotly_chart(cache.get(volume_chart, volume, "Daily Volume"))
+
+Cached figures are built Figure objects rather than JSON: st.plotly_chart
+re-validates a dict spec, which costs more than building the figure did.
+They are shared between sessions and must not be modified by callers.
+
+Clinician scans are free text, so the agreement heatmap normalizes them
+(case and whitespace variants, AI vocabulary spellings) and keeps the
+``MAX_HEATMAP_SCANS - 1`` most frequent, folding the rest into "Other".
+Cell labels are one ``texttemplate`` over a text matrix.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+FIGURE_CACHE_ENTRIES = 128
+MAX_HEATMAP_SCANS = 20
+OTHER = "Other"
+
+MODEL_METRICS = {"agreement": "Agreement Rate", "override": "Override Rate", "emergency": "Emergency Rate"}
+MODEL_COLORS = ["#f59e0b", "#0ea5e9", "#22c55e", "#a855f7", "#ef4444", "#14b8a6"]
+
+
+# ============================================
+# FIGURE CACHE
+# ============================================
+def _update(h, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        h.update(repr((type(value).__name__, labels, [str(t) for t in np.atleast_1d(value.dtypes)])).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (tuple, list)):
+        h.update(b"(")
+        for item in value:
+            _update(h, item)
+        h.update(b")")
+    else:
+        h.update(repr(value).encode())
+    h.update(b"\x00")
+
+
+def fingerprint(*values):
+    """Content hash of builder arguments (frames are hashed by value, not identity)."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in values:
+        _update(h, value)
+    return h.hexdigest()
+
+
+class FigureCache:
+    """Thread-safe LRU of built figures keyed by builder and input fingerprint."""
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, builder, *args, **kwargs):
+        key = (builder.__module__, builder.__qualname__, fingerprint(args, sorted(kwargs.items())))
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+        # Built outside the lock; two sessions racing on one key build it twice at worst.
+        fig = builder(*args, **kwargs)
+        with self._lock:
+            self._figures[key] = fig
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return fig
+
+    def stats(self):
+        return {"entries": len(self._figures), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+
+# ============================================
+# SCAN NORMALIZATION
+# ============================================
+def normalize_scans(matrix):
+    """Merge clinician scan spellings that differ only in case or whitespace.
+
+    A variant of an AI scan name takes the AI's spelling; other variants take
+    their most frequent spelling. ``matrix`` is queries.agreement_matrix output.
+    """
+    if matrix.empty:
+        return matrix
+    cleaned = matrix["Clinician Scan"].astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    key = cleaned.str.casefold()
+    spelling = {str(s).casefold(): s for s in matrix["AI Scan"].unique()}
+    by_count = matrix["Count"].groupby([key, cleaned]).sum().sort_values(ascending=False, kind="stable")
+    for k, label in by_count.index:
+        spelling.setdefault(k, label)
+    out = matrix.assign(**{"Clinician Scan": key.map(spelling)})
+    return out.groupby(["AI Scan", "Clinician Scan"], as_index=False, sort=False)["Count"].sum()
+
+
+def bound_scans(matrix, max_scans=MAX_HEATMAP_SCANS):
+    """Keep the ``max_scans - 1`` most frequent clinician scans; the rest become "Other"."""
+    totals = matrix.groupby("Clinician Scan")["Count"].sum().sort_values(ascending=False, kind="stable")
+    if len(totals) <= max_scans:
+        return matrix, list(totals.index)
+    keep = list(totals.index[:max_scans - 1])
+    scans = matrix["Clinician Scan"].where(matrix["Clinician Scan"].isin(keep), OTHER)
+    out = matrix.assign(**{"Clinician Scan": scans})
+    return out.groupby(["AI Scan", "Clinician Scan"], as_index=False)["Count"].sum(), keep + [OTHER]
+
+
+# ============================================
+# AI PERFORMANCE
+# ============================================
+def agreement_gauge(agreement_rate):
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=agreement_rate * 100,
+        title={'text': "Agreement Rate", 'font': {'size': 16, 'color': '#e2e8f0'}},
+        number={'suffix': "%", 'font': {'size': 36, 'color': '#f59e0b'}},
+        gauge={
+            'axis': {'range': [0, 100]},
+            'bar': {'color': '#f59e0b'},
+            'bgcolor': '#1e293b',
+            'steps': [
+                {'range': [0, 60], 'color': '#7f1d1d'},
+                {'range': [60, 80], 'color': '#78350f'},
+                {'range': [80, 100], 'color': '#14532d'}
+            ],
+            'threshold': {'line': {'color': '#22c55e', 'width': 4}, 'thickness': 0.75, 'value': 80}
+        }
+    ))
+    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', height=200, margin=dict(l=20, r=20, t=50, b=20))
+    return fig
+
+
+# ============================================
+# AGREEMENT ANALYSIS
+# ============================================
+def agreement_heatmap(matrix, max_scans=MAX_HEATMAP_SCANS):
+    """AI x clinician heatmap of a normalized agreement matrix, at most ``max_scans`` columns."""
+    bounded, scans = bound_scans(matrix, max_scans)
+    pivot = (bounded.pivot(index="AI Scan", columns="Clinician Scan", values="Count")
+             .reindex(columns=sorted(s for s in scans if s != OTHER) + [s for s in scans if s == OTHER])
+             .fillna(0))
+    counts = pivot.to_numpy(dtype=np.int64)
+    fig = go.Figure(data=go.Heatmap(
+        z=counts, x=pivot.columns, y=pivot.index,
+        text=np.where(counts > 0, counts.astype(str), ""), texttemplate="%{text}",
+        textfont=dict(color='white', size=14, family='Arial Black'),
+        colorscale=[[0, '#1e293b'], [0.5, '#0ea5e9'], [1, '#f59e0b']],
+        hovertemplate="AI: %{y}<br>Clinician: %{x}<br>Count: %{z}<extra></extra>",
+        colorbar=dict(title=dict(text="Cases", font=dict(color='#e2e8f0')))
+    ))
+    fig.update_layout(
+        title=dict(text='<b>Agreement Matrix</b>', font=dict(size=18, color='#e2e8f0')),
+        xaxis=dict(
+            title=dict(text='Clinician Decision', font=dict(color='#e2e8f0')),
+            tickangle=45, tickfont=dict(size=11, color='#94a3b8'), gridcolor='#334155'
+        ),
+        yaxis=dict(
+            title=dict(text='AI Recommendation', font=dict(color='#e2e8f0')),
+            tickfont=dict(size=11, color='#94a3b8'), gridcolor='#334155'
+        ),
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
+        height=500, margin=dict(l=150, r=50, t=80, b=150)
+    )
+    return fig
+
+
+def agreement_by_scan(scan_agreement):
+    colors = ['#ef4444' if r < 60 else '#f59e0b' if r < 80 else '#22c55e' for r in scan_agreement['Rate']]
+    fig = go.Figure(go.Bar(
+        y=scan_agreement['Scan Type'], x=scan_agreement['Rate'], orientation='h',
+        marker=dict(color=colors),
+        text=[f"{r:.0f}%" for r in scan_agreement['Rate']],
+        textposition='outside', textfont=dict(color='#e2e8f0')
+    ))
+    fig.add_vline(x=80, line_dash="dash", line_color="#22c55e", annotation_text="Target: 80%")
+    fig.update_layout(
+        xaxis=dict(title=dict(text='Agreement Rate (%)', font=dict(color='#e2e8f0')),
+                   range=[0, 110], tickfont=dict(color='#94a3b8'), gridcolor='#334155'),
+        yaxis=dict(tickfont=dict(color='#94a3b8')),
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
+        height=max(300, len(scan_agreement) * 40), margin=dict(l=20, r=80, t=20, b=50)
+    )
+    return fig
+
+
+def overridden_bars(counts, title, color):
+    fig = go.Figure(go.Bar(x=counts['count'], y=counts['value'], orientation='h',
+        marker=dict(color=color), text=counts['count'], textposition='outside'))
+    fig.update_layout(title=title, paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='#0f172a', height=300, xaxis=dict(gridcolor='#334155'),
+        yaxis=dict(tickfont=dict(color='#94a3b8')))
+    return fig
+
+
+# ============================================
+# MODEL COMPARISON
+# ============================================
+def _rgba(color, alpha):
+    r, g, b = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r}, {g}, {b}, {alpha})"
+
+
+def model_rates(series, metric, window_days):
+    """Rolling ``metric`` per model with its 95% interval as a shaded band."""
+    fig = go.Figure()
+    for color, (model, df) in zip(MODEL_COLORS * 2, series.groupby("model_name", sort=True)):
+        df = df.dropna(subset=[f"{metric}_rate"])
+        band = pd.concat([df[f"{metric}_high"], df[f"{metric}_low"][::-1]]) * 100
+        fig.add_trace(go.Scatter(x=pd.concat([df["day"], df["day"][::-1]]), y=band, fill="toself",
+            fillcolor=_rgba(color, 0.15), line=dict(width=0), hoverinfo="skip", showlegend=False))
+        fig.add_trace(go.Scatter(x=df["day"], y=df[f"{metric}_rate"] * 100, mode="lines", name=model,
+            line=dict(color=color, width=2), customdata=df[["cases", "accepted", "rejected"]],
+            hovertemplate="%{x|%Y-%m-%d}: %{y:.1f}%<br>cases %{customdata[0]}, "
+                          "accepted %{customdata[1]}, overridden %{customdata[2]}<extra>%{fullData.name}</extra>"))
+    fig.update_layout(title=f"{window_days}-day rolling {MODEL_METRICS[metric].lower()} (shaded: 95% CI)",
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a', height=380,
+        xaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')),
+        yaxis=dict(title=dict(text='%', font=dict(color='#e2e8f0')), gridcolor='#334155',
+                   tickfont=dict(color='#94a3b8')),
+        legend=dict(font=dict(color='#e2e8f0')))
+    return fig
+
+
+# ============================================
+# VOLUME, TRENDS & SCANS
+# ============================================
+def volume_chart(volume, title):
+    fig = go.Figure(go.Scatter(x=volume['date'], y=volume['count'], mode='lines+markers',
+        line=dict(color='#f59e0b', width=3), fill='tozeroy', fillcolor='rgba(245, 158, 11, 0.1)'))
+    fig.update_layout(title=title, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
+        xaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')),
+        yaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')), height=300)
+    return fig
+
+
+def triage_pie(triage_counts, total_cases):
+    fig = go.Figure(go.Pie(labels=triage_counts['triage'], values=triage_counts['count'], hole=0.6,
+        marker=dict(colors=['#22c55e', '#ef4444']), textinfo='label+percent'))
+    fig.update_layout(title="Classification", paper_bgcolor='rgba(0,0,0,0)', height=300,
+        annotations=[dict(text=f'{total_cases}', x=0.5, y=0.5, font=dict(size=24, color='#e2e8f0'), showarrow=False)])
+    return fig
+
+
+def scan_bars(scan_counts):
+    fig = go.Figure(go.Bar(y=scan_counts['primary_modality'], x=scan_counts['count'], orientation='h',
+        marker=dict(color=px.colors.sequential.YlOrBr[:len(scan_counts)][::-1]),
+        text=scan_counts['count'], textposition='outside', textfont=dict(color='#e2e8f0')))
+    fig.update_layout(title="Top Recommended Scans", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='#0f172a',
+        xaxis=dict(gridcolor='#334155', tickfont=dict(color='#94a3b8')),
+        yaxis=dict(tickfont=dict(color='#94a3b8')), height=400, margin=dict(r=80))
+    return fig
@@ -0,0 +1,168 @@
+# migrations.py
+"""
+Schema upgrades and the query-plan check for the dashboard's hot queries.
+
+    python migrations.py upgrade   # create missing tables, indexes, rollups and search index
+    python migrations.py check     # fail if a hot query falls back to a table scan
+
+``Base.metadata.create_all`` only creates missing *tables*; indexes added to
+the models later have to be created explicitly on existing databases, which
+is what ``upgrade`` does.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import data_loader
+import queries
+import rollups
+import search
+from database import Base, engine as default_engine
+from models import TriageLog, ClinicianFeedback
+
+INDEXED_TABLES = [TriageLog.__table__, ClinicianFeedback.__table__]
+# Indexes no hot query uses any more; dropped so inserts stop maintaining them.
+DROPPED_INDEXES = ["ix_triage_logs_model_created_at"]
+
+# Dashboard and loader calls that read the raw (unbounded) tables, windowed
+# and (where the dashboard issues them so) all-time. Windows that are not
+# whole days skip the rollups, so these arguments take the raw-row code
+# paths. ``full_scans`` captures the SQL each call actually emits, so a
+# change in queries.py is checked as soon as it is made.
+_START, _END = datetime(2025, 1, 1, 6), datetime(2025, 2, 1, 6)
+_BEFORE = (datetime(2025, 6, 1), 1_000_000)
+_MODALITY = "CT head"
+_SEARCH = "chest pain"
+
+
+def _hourly_volume(s):
+    # Hourly buckets are refused for windows reaching into the archive.
+    start = max(_START, queries.archive_cutoff(s) or _START)
+    return queries.volume_series(s, start=start, end=start + (_END - _START), granularity="hour")
+
+
+HOT_QUERIES = {
+    "kpis in date range": lambda s: queries.kpi_totals(s, start=_START, end=_END),
+    "hourly volume": _hourly_volume,
+    "triage counts in date range": lambda s: queries.triage_distribution(s, start=_START, end=_END),
+    "agreement in date range": lambda s: queries.agreement_by_modality(s, start=_START, end=_END),
+    "recent logs": lambda s: queries.recent_logs(s, limit=30),
+    "recent logs in date range": lambda s: queries.recent_logs(s, limit=30, start=_START, end=_END),
+    "recent feedback": lambda s: queries.recent_feedback(s, limit=25),
+    "recent disagreements": lambda s: queries.recent_feedback(s, limit=5, disagreements_only=True),
+    "feedback search": lambda s: queries.recent_feedback(s, limit=25, search_text=_SEARCH),
+    "overrides search": lambda s: queries.top_overridden(s, column="ai_scan", search_text=_SEARCH),
+    "case search": lambda s: queries.search_cases(s, _SEARCH),
+    "case picker first page": lambda s: queries.case_page(s),
+    "reviewed cases first page": lambda s: queries.case_page(s, status="reviewed"),
+    "case picker page": lambda s: queries.case_page(s, before=_BEFORE),
+    "case picker page by modality": lambda s: queries.case_page(s, status="all", modality=_MODALITY,
+                                                                 before=_BEFORE),
+    "reviewed cases in date range": lambda s: queries.case_page(s, status="reviewed", start=_START.date(),
+                                                                 end=_END.date()),
+    "incremental load": lambda s: data_loader.read_frame(
+        s.connection(), data_loader.TRIAGE_COLUMNS, where=TriageLog.id > _BEFORE[1], order_by=TriageLog.id),
+    "incremental feedback load": lambda s: data_loader.read_frame(
+        s.connection(), data_loader.FEEDBACK_COLUMNS, where=ClinicianFeedback.id > _BEFORE[1],
+        join_feedback=True, order_by=ClinicianFeedback.id),
+}
+
+
+def create_indexes(conn):
+    for table in INDEXED_TABLES:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    for name in DROPPED_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def upgrade(engine=default_engine):
+    """Bring an existing database up to the current schema."""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        create_indexes(conn)
+    rollups.ensure_rollups(engine)
+    search.ensure_search_index(engine)
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA optimize"))
+
+
+def captured_statements(conn, call):
+    """Run ``call(session)`` on ``conn`` and return the (sql, parameters) it executed."""
+    statements = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", capture)
+    try:
+        call(Session(bind=conn))
+    finally:
+        event.remove(conn, "before_cursor_execute", capture)
+    return statements
+
+
+def _walks_table(sql, plan):
+    """True if ``plan`` reads a whole table (or every row with a created_at).
+
+    "SCAN t" is a full table scan; "SCAN t USING [COVERING] INDEX ..." walks an
+    index, and scanning a subquery's result (CO-ROUTINE / MATERIALIZE) reads no
+    table. A SEARCH on ``created_at>?`` without an upper bound is the
+    ``created_at IS NOT NULL`` filter of an unwindowed query, i.e. a walk over
+    every row. Both are fine when the statement has a LIMIT and no sort step:
+    rows then come out in index order and the walk stops at the limit.
+    """
+    if " LIMIT " in sql and not any("TEMP B-TREE FOR ORDER BY" in line for line in plan):
+        return False
+    derived = {line.split()[1] for line in plan if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    for line in plan:
+        if line.startswith("SCAN ") and "INDEX" not in line and line.split()[1] not in derived:
+            return True
+        if line.startswith("SEARCH ") and "created_at>" in line and "created_at<" not in line:
+            return True
+    return False
+
+
+def full_scans(conn):
+    """Return {query name: plan lines} for hot queries that walk a whole table."""
+    offenders = {}
+    for name, call in HOT_QUERIES.items():
+        for sql, parameters in captured_statements(conn, call):
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+            if _walks_table(sql, plan):
+                offenders.setdefault(name, []).extend(plan)
+    return offenders
+
+
+def check_query_plans(engine=default_engine):
+    with engine.connect() as conn:
+        offenders = full_scans(conn)
+    if offenders:
+        details = "\n".join(f"  {name}: {' | '.join(plan)}" for name, plan in offenders.items())
+        raise RuntimeError(f"hot queries fall back to a table scan:\n{details}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema upgrades and query-plan check.")
+    parser.add_argument("command", choices=["upgrade", "check"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        upgrade()
+        print("schema up to date")
+        return 0
+    try:
+        check_query_plans()
+    except RuntimeError as e:
+        print(e)
+        return 1
+    print(f"{len(HOT_QUERIES)} hot queries use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
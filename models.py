@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -31,6 +31,13 @@ class TriageLog(Base):
     # one-to-one feedback (optional)
     feedback = relationship("ClinicianFeedback", back_populates="log", uselist=False)
 
+    # dashboard filters: date range x triage / modality (see migrations.py);
+    # per-model views read the rollups, so model_name has no index.
+    __table_args__ = (
+        Index("ix_triage_logs_created_at_triage", "created_at", "triage"),
+        Index("ix_triage_logs_modality_created_at", "primary_modality", "created_at"),
+    )
+
 
 class ClinicianFeedback(Base):
     __tablename__ = "clinician_feedback"
@@ -42,3 +49,56 @@ class ClinicianFeedback(Base):
     comment = Column(Text, nullable=True)
 
     log = relationship("TriageLog", back_populates="feedback")
+
+    __table_args__ = (
+        Index("ix_clinician_feedback_log_accepted", "triage_log_id", "accepted_recommendation"),
+        Index("ix_clinician_feedback_accepted", "accepted_recommendation"),
+    )
+
+
+# ============================================
+# ROLLUPS (maintained by triggers, see rollups.py)
+# ============================================
+# Missing dimension values are stored as "" so they can be part of the key.
+
+class DailyTriageRollup(Base):
+    __tablename__ = "daily_triage_rollup"
+
+    day = Column(Date, primary_key=True)
+    triage = Column(String, primary_key=True)
+    primary_modality = Column(String, primary_key=True)
+    model_name = Column(String, primary_key=True)
+    cases = Column(Integer, nullable=False, default=0)
+
+
+class AgreementRollup(Base):
+    __tablename__ = "agreement_rollup"
+
+    day = Column(Date, primary_key=True)              # day of the triage log
+    ai_scan = Column(String, primary_key=True)        # TriageLog.primary_modality
+    clinician_scan = Column(String, primary_key=True)
+    model_name = Column(String, primary_key=True)
+    feedback = Column(Integer, nullable=False, default=0)
+    accepted = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+
+
+class TableChanges(Base):
+    __tablename__ = "table_changes"
+
+    table_name = Column(String, primary_key=True)
+    changes = Column(Integer, nullable=False, default=0)  # rows inserted, updated or deleted
+
+
+# ============================================
+# ARCHIVE (see archive.py)
+# ============================================
+
+class ArchiveRun(Base):
+    __tablename__ = "archive_runs"
+
+    id = Column(Integer, primary_key=True)
+    run_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    cutoff = Column(DateTime, nullable=False)          # rows created before this were moved out
+    triage_rows = Column(Integer, nullable=False, default=0)
+    feedback_rows = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,209 @@
+# profiling.py
+"""
+Opt-in performance profile of one dashboard run.
+
+    SKANNR_PROFILE=1 streamlit run analytics_dashboard.py
+    # or open the dashboard with ?profile=1
+
+A ``Profiler`` splits the script into named sections (``profiler.section``
+marks where the next one starts) and records wall time per section. While a
+profiler is active on a thread, the engine events installed by
+``instrument`` attribute every SQL statement run on that thread to the
+current section: statement count, time in the driver and rows fetched or
+written. Other sessions' threads are not counted.
+
+Results are shown by the dashboard in a debug panel and emitted as JSON lines
+on the ``skannr.profile`` logger so production runs can be collected and
+compared. Unless the application has configured that logger itself, the
+first profiled run attaches a handler writing bare JSON lines to stderr, or
+appending to the file named by ``SKANNR_PROFILE_LOG``:
+
+    SKANNR_PROFILE=1 SKANNR_PROFILE_LOG=/var/log/skannr/profile.jsonl \
+        streamlit run analytics_dashboard.py
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import event
+
+PROFILE_ENV = "SKANNR_PROFILE"
+PROFILE_LOG_ENV = "SKANNR_PROFILE_LOG"  # file for the JSON lines; stderr if unset
+STATEMENT_WIDTH = 160
+
+logger = logging.getLogger("skannr.profile")
+_local = threading.local()
+_logging_lock = threading.Lock()
+
+
+def enabled_by_env():
+    return os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+def configure_logging():
+    """Give ``skannr.profile`` a handler unless the application configured one.
+
+    Without it INFO records reach only logging's last-resort handler, which
+    drops anything below WARNING.
+    """
+    with _logging_lock:
+        if logger.handlers:
+            return
+        path = os.environ.get(PROFILE_LOG_ENV)
+        handler = logging.FileHandler(path) if path else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class _Stats:
+    __slots__ = ("seconds", "queries", "rows", "sql_seconds")
+
+    def __init__(self):
+        self.seconds = self.sql_seconds = 0.0
+        self.queries = self.rows = 0
+
+
+class Profiler:
+    """Section timings plus SQL counters for the current thread."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.utcnow()
+        self.sections = {}
+        self.statements = defaultdict(_Stats)
+        self._current = None
+        self._last = None
+        self._mark = None
+
+    # ---- sections ----
+    def section(self, name):
+        """Close the running section (if any) and start timing ``name``."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._current is None:
+            _local.profiler = self
+        else:
+            self._current.seconds += now - self._mark
+        self._current = self.sections.setdefault(name, _Stats())
+        self._mark = now
+
+    def finish(self):
+        """Stop timing and detach from the thread; returns the records."""
+        if not self.enabled:
+            return []
+        if self._current is not None:
+            self._current.seconds += time.perf_counter() - self._mark
+            self._current = None
+        if getattr(_local, "profiler", None) is self:
+            _local.profiler = None
+        return self.records()
+
+    # ---- engine event callbacks ----
+    def _statement(self, statement, seconds, rows):
+        key = re.sub(r"\s+", " ", statement).strip()[:STATEMENT_WIDTH]
+        self._last = self.statements[key]
+        for stats in (self._current, self._last):
+            if stats is not None:
+                stats.queries += 1
+                stats.sql_seconds += seconds
+                stats.rows += rows
+
+    def _rows(self, n):
+        # Fetched rows belong to the statement most recently executed on this thread.
+        for stats in (self._current, self._last):
+            if stats is not None:
+                stats.rows += n
+
+    # ---- output ----
+    def records(self):
+        """Structured records: one per section, then one per distinct statement."""
+        base = {"run_id": self.run_id, "started_at": self.started_at.isoformat(timespec="seconds")}
+        out = []
+        for kind, items in (("section", self.sections), ("statement", self.statements)):
+            for name, s in items.items():
+                out.append({**base, "kind": kind, "name": name, "seconds": round(s.seconds, 4),
+                            "queries": s.queries, "rows": s.rows, "sql_seconds": round(s.sql_seconds, 4)})
+        return out
+
+    def sections_frame(self):
+        df = pd.DataFrame([r for r in self.records() if r["kind"] == "section"],
+                          columns=["name", "seconds", "sql_seconds", "queries", "rows"])
+        return df[["name", "seconds", "sql_seconds", "queries", "rows"]]
+
+    def statements_frame(self):
+        rows = [r for r in self.records() if r["kind"] == "statement"]
+        df = pd.DataFrame(rows, columns=["name", "queries", "sql_seconds", "rows"])
+        return df[["name", "queries", "sql_seconds", "rows"]].sort_values("sql_seconds", ascending=False)
+
+    def to_jsonl(self):
+        return "\n".join(json.dumps(r) for r in self.records())
+
+    def log(self):
+        configure_logging()
+        for record in self.records():
+            logger.info(json.dumps(record))
+
+
+def active():
+    """The profiler attached to the calling thread, if any."""
+    return getattr(_local, "profiler", None)
+
+
+# ============================================
+# ENGINE EVENTS
+# ============================================
+def _count_row(cursor, row):
+    profiler = active()
+    if profiler is not None:
+        profiler._rows(1)
+    return row
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if active() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiler = active()
+    started = conn.info.get("profile_started")
+    if profiler is None or not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    # SELECT rows are counted as they are fetched (see _count_row); rowcount covers writes.
+    written = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+    profiler._statement(statement, seconds, written)
+
+
+def _checkout(dbapi_conn, record, proxy):
+    # sqlite3 runs row_factory on every fetched row, which is how fetched rows
+    # are counted without wrapping SQLAlchemy's results.
+    if active() is not None and hasattr(dbapi_conn, "row_factory"):
+        dbapi_conn.row_factory = _count_row
+
+
+def _checkin(dbapi_conn, record):
+    if getattr(dbapi_conn, "row_factory", None) is _count_row:
+        dbapi_conn.row_factory = None
+
+
+def instrument(engine):
+    """Install the profiling listeners on ``engine`` (idempotent, cheap when idle)."""
+    for name, fn in (("before_cursor_execute", _before_cursor_execute),
+                     ("after_cursor_execute", _after_cursor_execute),
+                     ("checkout", _checkout), ("checkin", _checkin)):
+        if not event.contains(engine, name, fn):
+            event.listen(engine, name, fn)
+    return engine
@@ -0,0 +1,479 @@
+# queries.py
+"""
+SQL-side aggregations for the analytics dashboard.
+
+Every function runs a GROUP BY / COUNT query and returns a small result
+(a dict or a DataFrame with one row per group), so the dashboard never has
+to pull whole tables into pandas.
+
+Aggregates accept an optional ``[start, end)`` time window. Whole-day
+windows are answered from the rollup tables maintained by rollups.py, so
+their cost does not grow with the log history; other windows (e.g. the
+last 24 hours) aggregate the raw rows in the window through the
+``created_at`` indexes. Either way the aggregate reads a subquery with the
+rollup's columns, so each function has a single code path.
+
+Rows created before ``archive_cutoff`` may have been moved to the Parquet
+archive (archive.py). The rollups keep their counts, but the raw-row paths
+(hourly buckets, text search, the feedback lists) only see what is left in
+the database, so hourly buckets are not offered for such windows.
+"""
+
+from datetime import time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, case, literal, tuple_, union_all
+
+import search
+from models import TriageLog, ClinicianFeedback, DailyTriageRollup, AgreementRollup, ArchiveRun
+
+EMERGENCY = "URGENT_EMERGENCY"
+NON_EMERGENCY = "NON_EMERGENCY"
+
+D = DailyTriageRollup
+A = AgreementRollup
+
+GRANULARITIES = ("hour", "day", "week", "month")
+# Hourly buckets are counted from raw rows, so they need a bounded window.
+HOURLY_MAX_SPAN = timedelta(days=31)
+
+
+def _frame(session, stmt, columns):
+    return pd.DataFrame(session.execute(stmt).all(), columns=columns)
+
+
+def _total(column):
+    return func.coalesce(func.sum(column), 0)
+
+
+# ============================================
+# TIME WINDOWS
+# ============================================
+def _within(column, start, end):
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if end is not None:
+        conditions.append(column < end)
+    return conditions
+
+
+def _day_aligned(*moments):
+    return all(m is None or m.time() == time() for m in moments)
+
+
+def choose_granularity(start, end):
+    """Bucket size that keeps a trend chart to a readable number of points."""
+    span = end - start
+    if span <= timedelta(days=2):
+        return "hour"
+    if span <= timedelta(days=92):
+        return "day"
+    if span <= timedelta(days=2 * 366):
+        return "week"
+    return "month"
+
+
+def archive_cutoff(session):
+    """Rows created before this datetime may be in the Parquet archive (None if never archived)."""
+    return session.execute(select(func.max(ArchiveRun.cutoff))).scalar()
+
+
+def reaches_archive(start, cutoff):
+    """Whether a window starting at ``start`` covers archived rows."""
+    return cutoff is not None and (start is None or start < cutoff)
+
+
+def granularities(start, end, cutoff=None):
+    """Bucket sizes available for a window.
+
+    Hourly buckets only for bounded windows up to HOURLY_MAX_SPAN that do
+    not reach back before the archive ``cutoff``.
+    """
+    if start is None or end is None or end - start > HOURLY_MAX_SPAN or reaches_archive(start, cutoff):
+        return GRANULARITIES[1:]
+    return GRANULARITIES
+
+
+def date_bounds(session):
+    """(first, last) day with any triage log, from the rollup."""
+    first, last = session.execute(select(func.min(D.day), func.max(D.day))).one()
+    return first, last
+
+
+def _triage_source(start=None, end=None):
+    """Rows shaped like DailyTriageRollup for the window."""
+    if _day_aligned(start, end):
+        return select(D.day, D.triage, D.primary_modality, D.model_name, D.cases).where(
+            *_within(D.day, start and start.date(), end and end.date())).subquery()
+    t = TriageLog
+    dims = [func.date(t.created_at).label("day"), func.coalesce(t.triage, "").label("triage"),
+            func.coalesce(t.primary_modality, "").label("primary_modality"),
+            func.coalesce(t.model_name, "").label("model_name")]
+    return (
+        select(*dims, func.count(t.id).label("cases"))
+        .where(t.created_at.is_not(None), *_within(t.created_at, start, end))
+        .group_by(*dims).subquery()
+    )
+
+
+def _agreement_source(start=None, end=None, search_text=None):
+    """Rows shaped like AgreementRollup for the window (and optional text search)."""
+    if _day_aligned(start, end) and search.to_match_query(search_text) is None:
+        return select(A.day, A.ai_scan, A.clinician_scan, A.model_name, A.feedback, A.accepted,
+                      A.rejected).where(*_within(A.day, start and start.date(), end and end.date())).subquery()
+    t, f = TriageLog, ClinicianFeedback
+    dims = [func.date(t.created_at).label("day"), func.coalesce(t.primary_modality, "").label("ai_scan"),
+            func.coalesce(f.clinician_scan, "").label("clinician_scan"),
+            func.coalesce(t.model_name, "").label("model_name")]
+    stmt = _matching(
+        _feedback_join(
+            *dims, func.count(f.id).label("feedback"),
+            func.count(case((f.accepted_recommendation.is_(True), 1))).label("accepted"),
+            func.count(case((f.accepted_recommendation.is_(False), 1))).label("rejected"),
+        ).where(t.created_at.is_not(None), *_within(t.created_at, start, end)),
+        search_text,
+    )
+    return stmt.group_by(*dims).subquery()
+
+
+# ============================================
+# KPIs
+# ============================================
+def kpi_totals(session, start=None, end=None):
+    """Headline counts for the sidebar and KEY METRICS / AI PERFORMANCE rows."""
+    d, a = _triage_source(start, end).c, _agreement_source(start, end).c
+    total, emergencies, non_emergencies = session.execute(
+        select(
+            _total(d.cases),
+            _total(case((d.triage == EMERGENCY, d.cases))),
+            _total(case((d.triage == NON_EMERGENCY, d.cases))),
+        )
+    ).one()
+    feedback, accepted, rejected = session.execute(
+        select(_total(a.feedback), _total(a.accepted), _total(a.rejected))
+    ).one()
+    return {
+        "total_cases": total,
+        "emergency_cases": emergencies,
+        "non_emergency_cases": non_emergencies,
+        "feedback_count": feedback,
+        "cases_with_feedback": feedback,  # triage_log_id is unique per feedback
+        "agreement_rate": accepted / (accepted + rejected) if accepted + rejected else None,
+        "disagreements": rejected,
+    }
+
+
+# ============================================
+# VOLUME & TRENDS
+# ============================================
+def volume_series(session, start=None, end=None, granularity="day"):
+    """Case counts per hour/day/week (Monday)/month bucket (see ``granularities``)."""
+    if granularity not in granularities(start, end, archive_cutoff(session)):
+        raise ValueError(f"{granularity} buckets need a window of at most {HOURLY_MAX_SPAN.days} days "
+                         "within the database (not archived)")
+    if granularity == "hour":
+        t = TriageLog
+        bucket = func.strftime("%Y-%m-%d %H:00:00", t.created_at)
+        stmt = select(bucket, func.count(t.id)).where(
+            t.created_at.is_not(None), *_within(t.created_at, start, end))
+    else:
+        d = _triage_source(start, end).c
+        bucket = {
+            "day": d.day,
+            "week": func.date(d.day, "weekday 0", "-6 days"),
+            "month": func.strftime("%Y-%m-01", d.day),
+        }[granularity]
+        stmt = select(bucket, func.sum(d.cases)).having(func.sum(d.cases) > 0)
+    df = _frame(session, stmt.group_by(bucket).order_by(bucket), ["date", "count"])
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def triage_distribution(session, start=None, end=None):
+    d = _triage_source(start, end).c
+    n = func.sum(d.cases)
+    stmt = select(d.triage, n).group_by(d.triage).having(n > 0).order_by(n.desc())
+    return _frame(session, stmt, ["triage", "count"])
+
+
+# ============================================
+# SCAN DISTRIBUTION
+# ============================================
+def scan_distribution(session, limit=10, start=None, end=None):
+    d = _triage_source(start, end).c
+    n = func.sum(d.cases)
+    stmt = (
+        select(d.primary_modality, n)
+        .where(d.primary_modality != "")
+        .group_by(d.primary_modality).having(n > 0).order_by(n.desc()).limit(limit)
+    )
+    return _frame(session, stmt, ["primary_modality", "count"])
+
+
+# ============================================
+# AGREEMENT ANALYSIS
+# ============================================
+def agreement_matrix(session, start=None, end=None):
+    """AI scan x clinician scan counts (long form, ready to pivot)."""
+    a = _agreement_source(start, end).c
+    n = func.sum(a.feedback)
+    stmt = (
+        select(a.ai_scan, a.clinician_scan, n)
+        .where(a.ai_scan != "", a.clinician_scan != "")
+        .group_by(a.ai_scan, a.clinician_scan).having(n > 0)
+    )
+    return _frame(session, stmt, ["AI Scan", "Clinician Scan", "Count"])
+
+
+def agreement_by_modality(session, start=None, end=None):
+    a = _agreement_source(start, end).c
+    accepted, rated = func.sum(a.accepted), func.sum(a.accepted + a.rejected)
+    stmt = (
+        select(a.ai_scan, accepted, rated, 100.0 * accepted / func.nullif(rated, 0))
+        .where(a.ai_scan != "")
+        .group_by(a.ai_scan).having(rated > 0)
+    )
+    return _frame(session, stmt, ["Scan Type", "Agreements", "Total", "Rate"])
+
+
+def _feedback_join(*columns):
+    return select(*columns).join(TriageLog, ClinicianFeedback.triage_log_id == TriageLog.id)
+
+
+def _matching(stmt, search_text):
+    """Restrict a feedback query to cases matching a full-text search."""
+    match_query = search.to_match_query(search_text)
+    if match_query is None:
+        return stmt
+    return stmt.where(ClinicianFeedback.triage_log_id.in_(search.matching_ids(match_query)))
+
+
+def top_overridden(session, column, limit=5, search_text=None, start=None, end=None):
+    """Most frequent ``column`` values ("ai_scan"/"clinician_scan") among rejected recommendations."""
+    a = _agreement_source(start, end, search_text).c
+    value, n = a[column], func.sum(a.rejected)
+    stmt = (
+        select(value, n).where(value != "")
+        .group_by(value).having(n > 0).order_by(n.desc()).limit(limit)
+    )
+    return _frame(session, stmt, ["value", "count"])
+
+
+def recent_feedback(session, limit=25, disagreements_only=False, search_text=None, start=None, end=None):
+    stmt = _feedback_join(
+        TriageLog.created_at, TriageLog.primary_modality, ClinicianFeedback.clinician_scan,
+        ClinicianFeedback.accepted_recommendation, ClinicianFeedback.comment,
+    ).where(*_within(TriageLog.created_at, start, end))
+    if disagreements_only:
+        stmt = stmt.where(ClinicianFeedback.accepted_recommendation.is_(False))
+    stmt = _matching(stmt, search_text).order_by(ClinicianFeedback.id.desc()).limit(limit)
+    return _frame(session, stmt, ["created_at", "primary_modality", "clinician_scan",
+                                  "accepted_recommendation", "comment"])
+
+
+def search_cases(session, search_text, limit=100):
+    return search.search_cases(session, search_text, limit=limit)
+
+
+# ============================================
+# RECENT LOGS
+# ============================================
+def recent_logs(session, limit=30, start=None, end=None):
+    stmt = (
+        select(TriageLog.created_at, TriageLog.symptoms_text, TriageLog.age, TriageLog.sex,
+               TriageLog.triage, TriageLog.primary_modality)
+        .where(*_within(TriageLog.created_at, start, end))
+        .order_by(TriageLog.created_at.desc()).limit(limit)
+    )
+    return _frame(session, stmt, ["created_at", "symptoms_text", "age", "sex", "triage", "primary_modality"])
+
+
+# ============================================
+# CASE PICKER
+# ============================================
+CASE_STATUSES = ("pending", "reviewed", "all")
+
+
+def modality_options(session):
+    stmt = (
+        select(D.primary_modality).where(D.primary_modality != "")
+        .group_by(D.primary_modality).having(func.sum(D.cases) > 0).order_by(D.primary_modality)
+    )
+    return list(session.execute(stmt).scalars())
+
+
+def case_page(session, status="pending", triage=None, modality=None, start=None, end=None,
+              before=None, limit=50):
+    """One page of cases for the feedback picker, newest first.
+
+    Keyset pagination on ``(created_at, id)``: ``before`` is the key of the
+    last row of the previous page, so every page is an index range scan of
+    ``limit`` rows no matter how deep the user pages. ``status`` selects cases
+    without feedback ("pending"), with feedback ("reviewed") or both;
+    ``[start, end)`` is half-open like every other window in this module.
+    """
+    has_feedback = select(ClinicianFeedback.id).where(ClinicianFeedback.triage_log_id == TriageLog.id).exists()
+    stmt = select(
+        TriageLog.id, TriageLog.created_at, func.substr(TriageLog.symptoms_text, 1, 60),
+        TriageLog.triage, TriageLog.primary_modality,
+    ).where(TriageLog.created_at.is_not(None))
+    if status == "pending":
+        stmt = stmt.where(~has_feedback)
+    elif status == "reviewed":
+        stmt = stmt.where(has_feedback)
+    if triage:
+        stmt = stmt.where(TriageLog.triage == triage)
+    if modality:
+        stmt = stmt.where(TriageLog.primary_modality == modality)
+    if start:
+        stmt = stmt.where(TriageLog.created_at >= start)
+    if end:
+        stmt = stmt.where(TriageLog.created_at < end)
+    if before:
+        stmt = stmt.where(tuple_(TriageLog.created_at, TriageLog.id) < tuple_(*before))
+    stmt = stmt.order_by(TriageLog.created_at.desc(), TriageLog.id.desc()).limit(limit)
+    return _frame(session, stmt, ["id", "created_at", "preview", "triage", "primary_modality"])
+
+
+def get_case(session, case_id):
+    """Look up one triage log by primary key (None if it does not exist)."""
+    row = session.execute(
+        select(TriageLog.id, TriageLog.created_at, TriageLog.symptoms_text, TriageLog.triage,
+               TriageLog.primary_modality, TriageLog.primary_priority)
+        .where(TriageLog.id == case_id)
+    ).mappings().first()
+    return dict(row) if row else None
+
+
+# ============================================
+# MODEL COMPARISON
+# ============================================
+# Rolling rates are computed with window functions over the daily rollups, so
+# a series costs one pass over (days x models x modalities) rollup rows no
+# matter how many raw rows stand behind them.
+ROLLING_WINDOWS = (7, 30)
+Z_95 = 1.959964
+_COUNTS = ("cases", "emergencies", "accepted", "rejected")
+
+
+def wilson_interval(successes, trials, z=Z_95):
+    """Vectorized Wilson score interval; NaN where there were no trials."""
+    k = np.asarray(successes, dtype=float)
+    n = np.asarray(trials, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = k / n
+        denom = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denom
+        half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return centre - half, centre + half
+
+
+def _with_rates(df):
+    """Add emergency/agreement/override rates and their 95% intervals to a frame of counts."""
+    rated = df["accepted"] + df["rejected"]
+    for name, k, n in (("emergency", df["emergencies"], df["cases"]),
+                       ("agreement", df["accepted"], rated),
+                       ("override", df["rejected"], rated)):
+        low, high = wilson_interval(k, n)
+        df[f"{name}_rate"] = (k / n.where(n > 0)).astype(float)
+        df[f"{name}_low"], df[f"{name}_high"] = low, high
+    return df
+
+
+def _model_daily(by_modality, modality, start, end):
+    """Daily counts per model (and modality), merged from both rollups."""
+    zero = literal(0)
+    d_modality = D.primary_modality if by_modality or modality else literal("")
+    a_modality = A.ai_scan if by_modality or modality else literal("")
+    triage = select(
+        D.day, D.model_name, d_modality.label("modality"), D.cases.label("cases"),
+        case((D.triage == EMERGENCY, D.cases), else_=0).label("emergencies"),
+        zero.label("accepted"), zero.label("rejected"),
+    ).where(D.model_name != "", *_within(D.day, start, end))
+    agreement = select(
+        A.day, A.model_name, a_modality.label("modality"), zero, zero, A.accepted, A.rejected,
+    ).where(A.model_name != "", *_within(A.day, start, end))
+    if modality:
+        triage = triage.where(D.primary_modality == modality)
+        agreement = agreement.where(A.ai_scan == modality)
+    rows = union_all(triage, agreement).subquery()
+    keys = [rows.c.day, rows.c.model_name, rows.c.modality]
+    return (
+        select(*keys, *[func.sum(rows.c[c]).label(c) for c in _COUNTS]).group_by(*keys).subquery()
+    )
+
+
+def _days(start, end):
+    """The whole days covering ``[start, end)``."""
+    last = end and (end.date() if end.time() == time() else end.date() + timedelta(days=1))
+    return start and start.date(), last
+
+
+def model_rolling_metrics(session, window_days=7, by_modality=False, modality=None, start=None, end=None):
+    """Rolling ``window_days`` emergency, agreement and override rates per model and day.
+
+    Each row sums the model's counts over the window ending on ``day``
+    (calendar days, gaps included) with Wilson 95% intervals. ``by_modality``
+    splits every model's series by AI-recommended modality; ``modality``
+    restricts to one.
+    """
+    start_day, end_day = _days(start, end)
+    # Read window_days - 1 extra days so the first rows in range have full windows.
+    daily = _model_daily(by_modality, modality,
+                         start_day and start_day - timedelta(days=window_days - 1), end_day)
+    rolling = dict(
+        partition_by=[daily.c.model_name, daily.c.modality],
+        order_by=func.julianday(daily.c.day), range_=(-(window_days - 1), 0),
+    )
+    series = select(
+        daily.c.day, daily.c.model_name, daily.c.modality,
+        *[func.sum(daily.c[c]).over(**rolling).label(c) for c in _COUNTS],
+    ).subquery()
+    stmt = (
+        select(series).where(*_within(series.c.day, start_day, None))
+        .order_by(series.c.model_name, series.c.modality, series.c.day)
+    )
+    df = _frame(session, stmt, ["day", "model_name", "modality", *_COUNTS])
+    df["day"] = pd.to_datetime(df["day"])
+    return _with_rates(df)
+
+
+def model_summary(session, by_modality=False, modality=None, start=None, end=None):
+    """Side-by-side totals per model (and modality) for the window, with rates and intervals."""
+    daily = _model_daily(by_modality, modality, *_days(start, end))
+    keys = [daily.c.model_name, daily.c.modality]
+    stmt = (
+        select(*keys, *[func.sum(daily.c[c]) for c in _COUNTS])
+        .group_by(*keys).order_by(*keys)
+    )
+    return _with_rates(_frame(session, stmt, ["model_name", "modality", *_COUNTS]))
+
+
+# ============================================
+# CACHE DEPENDENCIES
+# ============================================
+# Source tables behind each query (the rollups count as their sources).
+# Callers that cache results per table version can keep triage-only results
+# when just clinician feedback changes.
+_BOTH = ("triage_logs", "clinician_feedback")
+QUERY_TABLES = {
+    "date_bounds": ("triage_logs",),
+    "archive_cutoff": ("triage_logs",),  # an archive run deletes triage logs
+    "kpi_totals": _BOTH,
+    "volume_series": ("triage_logs",),
+    "triage_distribution": ("triage_logs",),
+    "scan_distribution": ("triage_logs",),
+    "agreement_matrix": _BOTH,
+    "agreement_by_modality": _BOTH,
+    "top_overridden": _BOTH,
+    "recent_feedback": _BOTH,
+    "search_cases": _BOTH,
+    "recent_logs": ("triage_logs",),
+    "modality_options": ("triage_logs",),
+    "case_page": _BOTH,
+    "get_case": ("triage_logs",),
+    "model_rolling_metrics": _BOTH,
+    "model_summary": _BOTH,
+}
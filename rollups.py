@@ -0,0 +1,174 @@
+# rollups.py
+"""
+Incrementally maintained summary tables for the dashboard.
+
+``DailyTriageRollup`` and ``AgreementRollup`` (see models.py) are kept up to
+date by SQLite triggers on ``triage_logs`` and ``clinician_feedback``, so
+every writer -- the dashboard, the triage backend, a manual import -- updates
+them in the same transaction as the row itself. Logs without ``created_at``
+are not counted.
+
+``TableChanges`` counts every row inserted, updated or deleted in either
+table, so readers can tell which table a commit touched (data_loader.py).
+
+    python rollups.py rebuild     # recompute both rollups from raw rows
+"""
+
+import argparse
+
+from sqlalchemy import func, select, text
+
+from database import engine as default_engine
+from models import DailyTriageRollup, AgreementRollup, ArchiveRun, TableChanges
+
+# archive_runs is read by rebuild() to find the days that must be kept.
+ROLLUP_TABLES = [DailyTriageRollup.__table__, AgreementRollup.__table__, ArchiveRun.__table__,
+                 TableChanges.__table__]
+COUNTED_TABLES = ("triage_logs", "clinician_feedback")
+
+
+# ============================================
+# TRIGGER SQL
+# ============================================
+def _triage_upsert(row, delta):
+    return f"""
+    INSERT INTO daily_triage_rollup (day, triage, primary_modality, model_name, cases)
+    SELECT date({row}.created_at), coalesce({row}.triage, ''), coalesce({row}.primary_modality, ''),
+           coalesce({row}.model_name, ''), {delta}
+    WHERE {row}.created_at IS NOT NULL
+    ON CONFLICT (day, triage, primary_modality, model_name)
+    DO UPDATE SET cases = cases + excluded.cases;"""
+
+
+def _agreement_upsert(log, fb, source, where, delta):
+    return f"""
+    INSERT INTO agreement_rollup (day, ai_scan, clinician_scan, model_name, feedback, accepted, rejected)
+    SELECT date({log}.created_at), coalesce({log}.primary_modality, ''), coalesce({fb}.clinician_scan, ''),
+           coalesce({log}.model_name, ''), {delta},
+           {delta} * coalesce({fb}.accepted_recommendation = 1, 0),
+           {delta} * coalesce({fb}.accepted_recommendation = 0, 0)
+    FROM {source}
+    WHERE {where} AND {log}.created_at IS NOT NULL
+    ON CONFLICT (day, ai_scan, clinician_scan, model_name)
+    DO UPDATE SET feedback = feedback + excluded.feedback,
+                  accepted = accepted + excluded.accepted,
+                  rejected = rejected + excluded.rejected;"""
+
+
+def _feedback_of(log, delta):
+    return _agreement_upsert(log, "f", "clinician_feedback f", f"f.triage_log_id = {log}.id", delta)
+
+
+def _log_of(fb, delta):
+    return _agreement_upsert("t", fb, "triage_logs t", f"t.id = {fb}.triage_log_id", delta)
+
+
+TRIGGERS = {
+    "trg_triage_logs_rollup_insert": "AFTER INSERT ON triage_logs",
+    "trg_triage_logs_rollup_delete": "AFTER DELETE ON triage_logs",
+    "trg_triage_logs_rollup_update":
+        "AFTER UPDATE OF created_at, triage, primary_modality, model_name ON triage_logs",
+    "trg_clinician_feedback_rollup_insert": "AFTER INSERT ON clinician_feedback",
+    "trg_clinician_feedback_rollup_delete": "AFTER DELETE ON clinician_feedback",
+    "trg_clinician_feedback_rollup_update":
+        "AFTER UPDATE OF triage_log_id, clinician_scan, accepted_recommendation ON clinician_feedback",
+}
+TRIGGER_BODIES = {
+    # Feedback can reference a log before it exists; it is counted once the log arrives.
+    "trg_triage_logs_rollup_insert": _triage_upsert("NEW", 1) + _feedback_of("NEW", 1),
+    "trg_triage_logs_rollup_delete": _triage_upsert("OLD", -1) + _feedback_of("OLD", -1),
+    "trg_triage_logs_rollup_update": (
+        _triage_upsert("OLD", -1) + _triage_upsert("NEW", 1)
+        + _feedback_of("OLD", -1) + _feedback_of("NEW", 1)
+    ),
+    "trg_clinician_feedback_rollup_insert": _log_of("NEW", 1),
+    "trg_clinician_feedback_rollup_delete": _log_of("OLD", -1),
+    "trg_clinician_feedback_rollup_update": _log_of("OLD", -1) + _log_of("NEW", 1),
+}
+
+# Change counters need no backfill, so they do not take part in the
+# "trigger missing -> rebuild" decision in install().
+CHANGE_TRIGGERS = {
+    f"trg_{table}_changes_{op.lower()}": (f"AFTER {op} ON {table}", f"""
+    INSERT INTO table_changes (table_name, changes) VALUES ('{table}', 1)
+    ON CONFLICT (table_name) DO UPDATE SET changes = changes + 1;""")
+    for table in COUNTED_TABLES for op in ("INSERT", "UPDATE", "DELETE")
+}
+
+# Rollup rows for the triage logs matching {where} (alias t), in column order.
+TRIAGE_ROLLUP_SELECT = """
+    SELECT date(t.created_at) AS day, coalesce(t.triage, '') AS triage,
+           coalesce(t.primary_modality, '') AS primary_modality,
+           coalesce(t.model_name, '') AS model_name, count(*) AS cases
+    FROM triage_logs t WHERE t.created_at IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4"""
+AGREEMENT_ROLLUP_SELECT = """
+    SELECT date(t.created_at) AS day, coalesce(t.primary_modality, '') AS ai_scan,
+           coalesce(f.clinician_scan, '') AS clinician_scan,
+           coalesce(t.model_name, '') AS model_name, count(*) AS feedback,
+           sum(coalesce(f.accepted_recommendation = 1, 0)) AS accepted,
+           sum(coalesce(f.accepted_recommendation = 0, 0)) AS rejected
+    FROM clinician_feedback f JOIN triage_logs t ON t.id = f.triage_log_id
+    WHERE t.created_at IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4"""
+
+# Days before :since are left alone: their rows may have been moved to the
+# Parquet archive (archive.py), so the rollups are all that remains of them.
+REBUILD_SQL = [
+    "DELETE FROM daily_triage_rollup WHERE day >= :since",
+    "INSERT INTO daily_triage_rollup (day, triage, primary_modality, model_name, cases)"
+    + TRIAGE_ROLLUP_SELECT.format(where="date(t.created_at) >= :since"),
+    "DELETE FROM agreement_rollup WHERE day >= :since",
+    "INSERT INTO agreement_rollup (day, ai_scan, clinician_scan, model_name, feedback, accepted, rejected)"
+    + AGREEMENT_ROLLUP_SELECT.format(where="date(t.created_at) >= :since"),
+]
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+def install(conn):
+    """Create the rollup tables and triggers if missing.
+
+    Returns True when a trigger had to be created: until then writes were not
+    being counted, so the rollups need a backfill.
+    """
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+    for table in ROLLUP_TABLES:
+        table.create(conn, checkfirst=True)
+    for name, event in TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN{TRIGGER_BODIES[name]}\nEND"))
+    for name, (event, body) in CHANGE_TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN{body}\nEND"))
+    return not existing.issuperset(TRIGGERS)
+
+
+def rebuild(conn):
+    """Recompute both rollups from the raw tables, keeping archived days."""
+    cutoff = conn.execute(select(func.max(ArchiveRun.cutoff))).scalar()
+    since = cutoff.date().isoformat() if cutoff else ""
+    for sql in REBUILD_SQL:
+        conn.execute(text(sql), {"since": since})
+
+
+def ensure_rollups(engine=default_engine):
+    """Install rollups on ``engine``, backfilling them the first time."""
+    with engine.begin() as conn:
+        if install(conn):
+            rebuild(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the dashboard rollup tables.")
+    parser.add_argument("command", choices=["install", "rebuild"])
+    args = parser.parse_args()
+
+    with default_engine.begin() as conn:
+        created = install(conn)
+        if args.command == "rebuild" or created:
+            rebuild(conn)
+    print(f"rollups {'rebuilt' if args.command == 'rebuild' or created else 'installed'}")
+
+
+if __name__ == "__main__":
+    main()
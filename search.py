@@ -0,0 +1,142 @@
+# search.py
+"""
+Full-text search over triage cases (SQLite FTS5).
+
+``case_search`` holds one document per triage log (rowid = ``triage_logs.id``)
+with its ``symptoms_text``, ``implants`` and clinician ``comment``. Triggers
+on both source tables keep it in sync, the same way rollups.py maintains the
+summary tables.
+
+    python search.py rebuild
+    python search.py query "chest pain pacemaker"
+"""
+
+import argparse
+import re
+
+import pandas as pd
+from sqlalchemy import column, select, table, text
+
+from database import engine as default_engine, session_scope
+
+FTS_TABLE = "case_search"
+case_search = table(FTS_TABLE, column("rowid"))
+
+CREATE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    symptoms_text, implants, comment, tokenize = 'porter unicode61'
+)"""
+
+_COMMENT_OF = "(SELECT comment FROM clinician_feedback WHERE triage_log_id = {row}.id)"
+
+TRIGGERS = {
+    "trg_triage_logs_search_insert": ("AFTER INSERT ON triage_logs", f"""
+    INSERT INTO {FTS_TABLE} (rowid, symptoms_text, implants, comment)
+    VALUES (NEW.id, NEW.symptoms_text, NEW.implants, {_COMMENT_OF.format(row="NEW")});"""),
+    "trg_triage_logs_search_delete": ("AFTER DELETE ON triage_logs", f"""
+    DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id;"""),
+    "trg_triage_logs_search_update": ("AFTER UPDATE OF symptoms_text, implants ON triage_logs", f"""
+    UPDATE {FTS_TABLE} SET symptoms_text = NEW.symptoms_text, implants = NEW.implants
+    WHERE rowid = NEW.id;"""),
+    "trg_clinician_feedback_search_insert": ("AFTER INSERT ON clinician_feedback", f"""
+    UPDATE {FTS_TABLE} SET comment = NEW.comment WHERE rowid = NEW.triage_log_id;"""),
+    "trg_clinician_feedback_search_delete": ("AFTER DELETE ON clinician_feedback", f"""
+    UPDATE {FTS_TABLE} SET comment = NULL WHERE rowid = OLD.triage_log_id;"""),
+    "trg_clinician_feedback_search_update": ("AFTER UPDATE OF comment, triage_log_id ON clinician_feedback", f"""
+    UPDATE {FTS_TABLE} SET comment = NULL WHERE rowid = OLD.triage_log_id;
+    UPDATE {FTS_TABLE} SET comment = NEW.comment WHERE rowid = NEW.triage_log_id;"""),
+}
+
+REBUILD_SQL = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, symptoms_text, implants, comment)
+    SELECT t.id, t.symptoms_text, t.implants, f.comment
+    FROM triage_logs t LEFT JOIN clinician_feedback f ON f.triage_log_id = t.id""",
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')",
+]
+
+
+# ============================================
+# QUERY SYNTAX
+# ============================================
+def to_match_query(user_text):
+    """Turn free text such as "chest pain + pacemaker" into an FTS5 query.
+
+    Every word must match (implicit AND); the last word also matches as a
+    prefix so results appear while the user is still typing. FTS5 operators
+    are not passed through, so no input can produce a syntax error.
+    """
+    words = re.findall(r"\w+", user_text or "")
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def matching_ids(match_query):
+    """Subquery of triage log ids matching ``match_query`` (for IN filters)."""
+    return select(case_search.c.rowid).where(
+        text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=match_query))
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+def search_cases(session, user_text, limit=100):
+    """Best-ranked cases for ``user_text``: id, created_at, snippet, triage, modality."""
+    match_query = to_match_query(user_text)
+    if match_query is None:
+        return pd.DataFrame(columns=["id", "created_at", "snippet", "triage", "primary_modality"])
+    rows = session.execute(text(f"""
+        SELECT t.id, t.created_at,
+               snippet({FTS_TABLE}, -1, '**', '**', '…', 12),
+               t.triage, t.primary_modality
+        FROM {FTS_TABLE} JOIN triage_logs t ON t.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :q
+        ORDER BY bm25({FTS_TABLE}) LIMIT :limit"""), {"q": match_query, "limit": limit}).all()
+    return pd.DataFrame(rows, columns=["id", "created_at", "snippet", "triage", "primary_modality"])
+
+
+def install(conn):
+    """Create the FTS table and triggers if missing; True if a backfill is needed."""
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+    conn.execute(text(CREATE_SQL))
+    for name, (event, body) in TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN{body}\nEND"))
+    return not existing.issuperset(TRIGGERS)
+
+
+def rebuild(conn):
+    for sql in REBUILD_SQL:
+        conn.execute(text(sql))
+
+
+def ensure_search_index(engine=default_engine):
+    with engine.begin() as conn:
+        if install(conn):
+            rebuild(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage and query the case full-text index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild")
+    q = sub.add_parser("query")
+    q.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        with default_engine.begin() as conn:
+            install(conn)
+            rebuild(conn)
+        print("search index rebuilt")
+    else:
+        ensure_search_index()
+        with session_scope() as session:
+            print(search_cases(session, args.text).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
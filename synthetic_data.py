@@ -0,0 +1,157 @@
+# synthetic_data.py
+"""
+Synthetic TriageLog / ClinicianFeedback data at realistic scale.
+
+    python synthetic_data.py synthetic.db --rows 1000000
+    python synthetic_data.py synthetic.db --rows 10000 --emergency-rate 0.3 \\
+        --modalities "CT head=3,MRI brain=2,Chest X-ray=5" --acceptance-rate 0.7
+
+Rows are bulk-inserted into fresh tables first; the rollups, search index
+and secondary indexes are then built once by ``migrations.upgrade`` instead
+of firing triggers per row.
+"""
+
+import argparse
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy.schema import CreateTable
+
+import migrations
+from database import make_engine
+
+DEFAULT_MODALITIES = {
+    "Chest X-ray": 0.22, "CT head": 0.16, "MRI brain": 0.12, "Ultrasound abdomen": 0.12,
+    "CT chest": 0.08, "MRI spine": 0.08, "X-ray knee": 0.07, "Ultrasound axilla": 0.05,
+    "CT abdomen and pelvis": 0.05, "MRI knee": 0.05,
+}
+DEFAULT_MODELS = {"gemini-2.0-flash-001": 0.7, "gemini-2.5-flash": 0.3}
+
+SYMPTOMS = [
+    "chest pain radiating to the left arm", "headache for three days", "lump under my armpit",
+    "lower back pain after lifting", "knee pain and swelling after football",
+    "shortness of breath when walking uphill", "abdominal pain on the right side",
+    "dizzy spells and blurred vision", "persistent cough with fever", "numbness in both legs",
+]
+DURATIONS = ["since this morning", "for a week", "on and off for months", "getting worse", ""]
+IMPLANTS = ["", "", "", "", "pacemaker", "cochlear implant", "hip replacement", "insulin pump"]
+COMMENTS = [None, None, None, "agree", "clinically indicated", "MRI preferred for soft tissue",
+            "start with X-ray", "needs senior review"]
+PRIORITIES = {"URGENT_EMERGENCY": "Immediate", "NON_EMERGENCY": "Routine"}
+
+BATCH = 50_000
+
+
+@dataclass
+class SyntheticConfig:
+    rows: int = 10_000
+    days: int = 365
+    emergency_rate: float = 0.15
+    feedback_ratio: float = 0.1
+    acceptance_rate: float = 0.8
+    modalities: dict = field(default_factory=lambda: dict(DEFAULT_MODALITIES))
+    models: dict = field(default_factory=lambda: dict(DEFAULT_MODELS))
+    end: datetime = field(default_factory=datetime.utcnow)
+    seed: int = 0
+
+
+def _weights(mapping):
+    p = np.array(list(mapping.values()), dtype=float)
+    return list(mapping), p / p.sum()
+
+
+def _triage_batches(cfg, rng):
+    modalities, p_modality = _weights(cfg.modalities)
+    models, p_model = _weights(cfg.models)
+    span = cfg.days * 86_400
+    # Sorted offsets keep ids increasing with created_at, like real ingest.
+    offsets = np.sort(rng.uniform(0, span, cfg.rows))
+    start = cfg.end - timedelta(seconds=span)
+    for lo in range(0, cfg.rows, BATCH):
+        n = min(BATCH, cfg.rows - lo)
+        stamps = (np.datetime64(start, "us") + (offsets[lo:lo + n] * 1e6).astype("timedelta64[us]"))
+        triage = np.where(rng.random(n) < cfg.emergency_rate, "URGENT_EMERGENCY", "NON_EMERGENCY")
+        modality = rng.choice(modalities, n, p=p_modality)
+        symptoms = [f"{a} {b}".strip() for a, b in zip(rng.choice(SYMPTOMS, n), rng.choice(DURATIONS, n))]
+        age = rng.integers(0, 96, n)
+        has_age = rng.random(n) > 0.1
+        sex = rng.choice(["Male", "Female", None], n, p=[0.48, 0.48, 0.04])
+        rows = zip(
+            range(lo + 1, lo + n + 1), np.datetime_as_string(stamps, unit="us"), symptoms,
+            age.tolist(), has_age.tolist(), sex, rng.choice(IMPLANTS, n), triage,
+            modality, rng.choice(models, n, p=p_model),
+        )
+        yield [
+            (i, ts.replace("T", " "), text, a if known else None, s, imp, tri,
+             f"Consider {mod}.", mod, PRIORITIES[tri], model)
+            for i, ts, text, a, known, s, imp, tri, mod, model in rows
+        ], modality
+
+
+def generate(engine, cfg):
+    """Fill the (empty) database behind ``engine`` according to ``cfg``."""
+    rng = np.random.default_rng(cfg.seed)
+    modalities_sorted = np.array(sorted(cfg.modalities))
+    with engine.begin() as conn:
+        # Bare tables: the declared secondary indexes are built once after the load.
+        for table in migrations.INDEXED_TABLES:
+            conn.execute(CreateTable(table))
+        for batch, batch_modality in _triage_batches(cfg, rng):
+            conn.exec_driver_sql(
+                "INSERT INTO triage_logs (id, created_at, symptoms_text, age, sex, implants, triage, "
+                "recommendation, primary_modality, primary_priority, model_name) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+            reviewed = np.flatnonzero(rng.random(len(batch)) < cfg.feedback_ratio)
+            accepted = rng.random(len(reviewed)) < cfg.acceptance_rate
+            # A rejection picks any modality other than the AI's.
+            ai_index = np.searchsorted(modalities_sorted, batch_modality[reviewed])
+            shift = rng.integers(1, max(len(modalities_sorted), 2), len(reviewed))
+            other = modalities_sorted[(ai_index + shift) % len(modalities_sorted)]
+            clinician = np.where(accepted, batch_modality[reviewed], other)
+            comments = rng.choice(COMMENTS, len(reviewed))
+            conn.exec_driver_sql(
+                "INSERT INTO clinician_feedback (triage_log_id, clinician_scan, accepted_recommendation, comment) "
+                "VALUES (?, ?, ?, ?)",
+                [(batch[i][0], scan, ok, note)
+                 for i, scan, ok, note in zip(reviewed.tolist(), clinician.tolist(), accepted.tolist(), comments)])
+    migrations.upgrade(engine)
+
+
+def _parse_weights(spec):
+    pairs = (item.rsplit("=", 1) for item in spec.split(",") if item.strip())
+    return {name.strip(): float(weight) for name, weight in pairs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Skannr database.")
+    parser.add_argument("path", help="SQLite file to create (must not exist)")
+    parser.add_argument("--rows", type=int, default=SyntheticConfig.rows)
+    parser.add_argument("--days", type=int, default=SyntheticConfig.days)
+    parser.add_argument("--emergency-rate", type=float, default=SyntheticConfig.emergency_rate)
+    parser.add_argument("--feedback-ratio", type=float, default=SyntheticConfig.feedback_ratio)
+    parser.add_argument("--acceptance-rate", type=float, default=SyntheticConfig.acceptance_rate)
+    parser.add_argument("--modalities", type=_parse_weights, help='e.g. "CT head=3,MRI brain=2"')
+    parser.add_argument("--models", type=_parse_weights, help='e.g. "model-a=1,model-b=1"')
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    cfg = SyntheticConfig(
+        rows=args.rows, days=args.days, emergency_rate=args.emergency_rate,
+        feedback_ratio=args.feedback_ratio, acceptance_rate=args.acceptance_rate, seed=args.seed,
+        modalities=args.modalities or dict(DEFAULT_MODALITIES), models=args.models or dict(DEFAULT_MODELS),
+    )
+    engine = make_engine(f"sqlite:///{args.path}")
+    started = time.perf_counter()
+    generate(engine, cfg)
+    engine.dispose()
+    print(f"wrote {cfg.rows:,} triage logs to {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()